@@ -1,8 +1,31 @@
 # context.area: VIEW_3D
+import argparse
+import base64
+import bmesh
 import bpy
+import functools
+import glob
+import hashlib
+import numpy as np
+import json
+import mmap
 import os
+import queue
+import re
+import shutil
+import struct
 import subprocess
-from bpy.props import BoolProperty, StringProperty, PointerProperty
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import urllib.request
+from collections import deque, namedtuple
+from contextlib import contextmanager
+from mathutils import Matrix
+from bpy.app.handlers import persistent
+from bpy.props import BoolProperty, EnumProperty, FloatProperty, IntProperty, StringProperty, PointerProperty
 
 
 bl_info = {
@@ -18,6 +41,8 @@ bl_info = {
     "panel_label_export": "Export",
     "panel_id_name_substance_link": "Taper_Substance_Link_Panel",
     "panel_label_substance_link": "Substance Link",
+    "panel_id_name_diagnostics": "Taper_Diagnostics_Panel",
+    "panel_label_diagnostics": "Last Run",
     "operator_id_prefix": "taper"
 }
 
@@ -32,6 +57,35 @@ class TaperPreference(bpy.types.AddonPreferences):
         subtype='FILE_PATH'
     )
 
+    reuse_painter_session: BoolProperty(
+        name="Reuse Painter Session",
+        description="Send mesh updates to an open Substance Painter instead of launching a new one.",
+        default=True
+    )
+
+    painter_remote_port: IntProperty(
+        name="Remote Scripting Port",
+        description="Port of Substance Painter's remote scripting server.",
+        default=60041,
+        min=1,
+        max=65535
+    )
+
+    profile_history: IntProperty(
+        name="Runs Kept",
+        description="Number of operator runs kept for the Last Run panel.",
+        default=20,
+        min=1,
+        max=500
+    )
+
+    profile_log_path: StringProperty(
+        name="Timing Log",
+        default="",
+        description="Append the timings of every run as JSON lines to this file.",
+        subtype='FILE_PATH'
+    )
+
     def draw(self, context):
         layout = self.layout
 
@@ -39,6 +93,39 @@ class TaperPreference(bpy.types.AddonPreferences):
         col.label(text="Substance Painter Path")
         col.prop(self, "substance_painter_path", text="")
 
+        row = layout.row()
+        row.prop(self, "reuse_painter_session")
+        row.prop(self, "painter_remote_port")
+
+        row = layout.row()
+        row.prop(self, "profile_history")
+        row.prop(self, "profile_log_path")
+
+
+def update_texture_proxies(self, context):
+    if not self.use_proxies:
+        TextureProxies.cancel()
+    TextureProxies.swap_all(self.use_proxies)
+
+
+def update_live_sync(self, context):
+    if not self.live_sync:
+        LiveSync.stop()
+        return
+
+    # The texture folder sits next to the export folder, which needs a saved file
+    export_path, error = Utils.get_export_path(self)
+    if export_path == None:
+        self.live_sync = False
+        context.window_manager.popup_menu(
+            lambda menu, context: menu.layout.label(text="Live Sync: " + error),
+            title="Taper",
+            icon='ERROR'
+        )
+        return
+
+    LiveSync.start(Utils.get_textures_export_path(context, self))
+
 
 class Configs(bpy.types.PropertyGroup):
 
@@ -63,10 +150,326 @@ class Configs(bpy.types.PropertyGroup):
         subtype='DIR_PATH'
     )
 
+    verify_texture_hash: BoolProperty(
+        name="Verify Content",
+        description="Hash texture files to skip reloading files rewritten with identical content.",
+        default=False
+    )
+
+    flatten_constant_maps: BoolProperty(
+        name="Flatten Constant Maps",
+        description="Set the shader value directly for maps that hold a single flat value instead of loading them.",
+        default=False
+    )
+
+    pack_channels: BoolProperty(
+        name="Pack Grayscale Maps",
+        description="Merge the metallic, roughness, specular and 8 bit height maps of a material into one image.",
+        default=False
+    )
+
+    use_proxies: BoolProperty(
+        name="Viewport Proxies",
+        description="Show downscaled copies of pulled textures in the viewport and swap to full resolution when rendering.",
+        default=False,
+        update=update_texture_proxies
+    )
+
+    proxy_size: EnumProperty(
+        name="Proxy Size",
+        description="Largest side of the viewport proxies.",
+        items=[
+            ('1024', "1K", "Downscale to 1024 pixels"),
+            ('512', "512", "Downscale to 512 pixels")
+        ],
+        default='1024'
+    )
+
+    use_node_groups: BoolProperty(
+        name="Shared Node Groups",
+        description="Build the shader setup once per channel layout as a node group shared by every material using it.",
+        default=False
+    )
+
+    keep_shading: BoolProperty(
+        name="Keep Viewport Shading",
+        description="Leave the viewport shading as it is instead of switching to Rendered after pulling or cleaning.",
+        default=False
+    )
+
+    atlas_size: EnumProperty(
+        name="Atlas Size",
+        description="Width and height of each atlas page.",
+        items=[
+            ('1024', "1024", "1024 x 1024 pages"),
+            ('2048', "2048", "2048 x 2048 pages"),
+            ('4096', "4096", "4096 x 4096 pages")
+        ],
+        default='2048'
+    )
+
+    atlas_max_texture: IntProperty(
+        name="Max Texture",
+        description="Texture sets larger than this keep their own material.",
+        default=512,
+        min=16
+    )
+
+    atlas_padding: IntProperty(
+        name="Padding",
+        description="Pixels of repeated edge around each texture set in the atlas.",
+        default=8,
+        min=0,
+        max=64
+    )
+
+    parallel_export: BoolProperty(
+        name="Parallel Export",
+        description="Export collections in background Blender processes.",
+        default=False
+    )
+
+    parallel_prep: BoolProperty(
+        name="Parallel Unwrap",
+        description="Unwrap objects in background Blender processes.",
+        default=False
+    )
+
+    async_export: BoolProperty(
+        name="Export in Background",
+        description="Export in a background Blender process and keep working while it runs.",
+        default=False
+    )
+
+    incremental_export: BoolProperty(
+        name="Only Changed",
+        description="Skip collections whose meshes, transforms, modifiers and materials did not change since the last export.",
+        default=False
+    )
+
+    export_format: EnumProperty(
+        name="Format",
+        description="File format the collections are exported to.",
+        items=[
+            ('FBX', "FBX", "Autodesk FBX"),
+            ('GLB', "glTF Binary", "One .glb file per collection"),
+            ('GLTF', "glTF Separate", "A .gltf file with its .bin and textures next to it")
+        ],
+        default='FBX'
+    )
+
+    gltf_draco: BoolProperty(
+        name="Draco Compression",
+        description="Compress glTF meshes with Draco.",
+        default=True
+    )
+
+    gltf_draco_level: IntProperty(
+        name="Level",
+        description="Draco compression level, higher is smaller and slower to decode.",
+        default=6,
+        min=0,
+        max=10
+    )
+
+    gltf_image_format: EnumProperty(
+        name="Images",
+        description="Format of the textures written with glTF.",
+        items=[
+            ('AUTO', "Automatic", "Keep PNG and JPEG as they are"),
+            ('JPEG', "JPEG", "Convert every texture to JPEG"),
+            ('WEBP', "WebP", "Convert every texture to WebP, needs Blender 4.0 or later"),
+            ('NONE', "None", "Do not write textures")
+        ],
+        default='AUTO'
+    )
+
+    compare_formats: BoolProperty(
+        name="Compare with FBX",
+        description="Also write FBX in the background and report the size and import time of both formats.",
+        default=False
+    )
+
+    export_lods: BoolProperty(
+        name="Export LODs",
+        description="Add decimated _LOD1 to _LODn copies of every mesh to the exported files.",
+        default=False
+    )
+
+    lod_mode: EnumProperty(
+        name="LOD Mode",
+        description="How the LOD levels are given.",
+        items=[
+            ('RATIO', "Ratio", "Each level is the share of faces kept"),
+            ('SCREEN_SIZE', "Screen Size", "Each level is the share of screen height it is shown at")
+        ],
+        default='RATIO'
+    )
+
+    lod_levels: StringProperty(
+        name="Levels",
+        description="One value between 0 and 1 per level after LOD0, separated by spaces.",
+        default="0.5 0.25 0.125"
+    )
+
+    export_workers: IntProperty(
+        name="Workers",
+        description="Number of background Blender processes used to export.",
+        default=max(1, (os.cpu_count() or 2) // 2),
+        min=1
+    )
+
+    batch_scope: EnumProperty(
+        name="Scope",
+        description="Objects whose materials the Substance operators process.",
+        items=[
+            ('ACTIVE', "Active Object", "Materials of the active object"),
+            ('SELECTED', "Selected Objects", "Materials of every selected object"),
+            ('COLLECTION', "Active Collection", "Materials of every object in the active collection")
+        ],
+        default='ACTIVE'
+    )
+
+    live_sync: BoolProperty(
+        name="Live Sync",
+        description="Watch the texture export folder and reload textures as Painter exports them.",
+        default=False,
+        update=update_live_sync
+    )
+
+    live_sync_debounce: FloatProperty(
+        name="Settle Time",
+        description="Seconds a file must stay unchanged before it is reloaded.",
+        default=1.0,
+        min=0.1,
+        subtype='TIME',
+        unit='TIME'
+    )
+
+
+class Profiler(object):
+
+    # Timings of the last runs, newest last
+    runs = deque(maxlen=20)
+    current = None
+    stack = []
+
+    @staticmethod
+    def get_settings():
+        try:
+            preferences = Utils.get_preferences(bpy.context)
+        except (AttributeError, KeyError):
+            return 20, None
+
+        log_path = preferences.profile_log_path
+        return preferences.profile_history, bpy.path.abspath(log_path) if log_path else None
+
+    @classmethod
+    @contextmanager
+    def run(cls, name):
+        if cls.current is not None:
+            with cls.span(name):
+                yield
+            return
+
+        cls.current = {"name": name, "time": time.time(), "spans": {}}
+        cls.stack = []
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            run = cls.current
+            cls.current = None
+            run["total"] = time.perf_counter() - start
+            if not run.get("discarded"):
+                cls.finish(run)
+
+    @classmethod
+    def discard(cls):
+        # The work moved elsewhere and records its own timing
+        if cls.current is not None:
+            cls.current["discarded"] = True
+
+    @classmethod
+    @contextmanager
+    def span(cls, name):
+        if cls.current is None:
+            yield
+            return
+
+        # Time spent in nested spans is not counted twice
+        children = [0.0]
+        cls.stack.append(children)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            cls.stack.pop()
+            if cls.stack:
+                cls.stack[-1][0] += elapsed
+
+            if cls.current is not None:
+                span = cls.current["spans"].setdefault(name, {"time": 0.0, "count": 0})
+                span["time"] += elapsed - children[0]
+                span["count"] += 1
+
+    @classmethod
+    def timed(cls, name):
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with cls.span(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @classmethod
+    def operator(cls, execute):
+        @functools.wraps(execute)
+        def wrapper(self, context):
+            with cls.run(self.bl_label):
+                return execute(self, context)
+        return wrapper
+
+    @classmethod
+    def record(cls, name, spans, total):
+        cls.finish({
+            "name": name,
+            "time": time.time(),
+            "spans": {key: {"time": value, "count": 1} for key, value in spans.items()},
+            "total": total
+        })
+
+    @classmethod
+    def finish(cls, run):
+        history, log_path = cls.get_settings()
+        if not cls.runs.maxlen == history:
+            cls.runs = deque(cls.runs, maxlen=history)
+        cls.runs.append(run)
+
+        if log_path:
+            try:
+                with open(log_path, 'a') as f:
+                    f.write(json.dumps(run) + "\n")
+            except OSError as e:
+                print("Could not write timings to " + log_path + " : " + str(e))
+
 
 class Utils(object):
 
+    export_extensions = {'FBX': ".fbx", 'GLB': ".glb", 'GLTF': ".gltf"}
+    shader_input_aliases = {'Specular': "Specular IOR Level"}
+
     @staticmethod
+    def start_async_export(**options):
+        # The modal export records the real timing once its workers finish
+        Profiler.discard()
+        result = bpy.ops.taper.export_async('INVOKE_DEFAULT', **options)
+        return {'CANCELLED'} if 'CANCELLED' in result else {'FINISHED'}
+
+    @staticmethod
+    @Profiler.timed("resolve_path")
     def get_export_path(configs: Configs, filename=None, clean=False):
         if not bpy.data.is_saved:
             return None, "File not saved"
@@ -87,7 +490,8 @@ class Utils(object):
 
         if not (filename == None):
             folderPath = os.path.join(folderPath, filename)
-            folderPath = bpy.path.ensure_ext(folderPath, ".fbx")
+            folderPath = bpy.path.ensure_ext(
+                folderPath, Utils.export_extensions[configs.export_format])
 
         return folderPath, None
 
@@ -103,6 +507,7 @@ class Utils(object):
         Utils.ensure_path(textures_path)
 
     @staticmethod
+    @Profiler.timed("resolve_path")
     def get_sp_project_path(context, configs: Configs, name):
         export_path, error = Utils.get_export_path(configs, clean=True)
 
@@ -125,6 +530,7 @@ class Utils(object):
         return sp_project_path
 
     @staticmethod
+    @Profiler.timed("resolve_path")
     def get_textures_export_path(context, configs: Configs):
         export_path, error = Utils.get_export_path(configs)
         textures_path = os.path.join(
@@ -137,191 +543,3227 @@ class Utils(object):
 
         return textures_path
 
+    @staticmethod
+    def get_file_hash(path):
+        digest = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def get_fbx_export_settings():
+        return {
+            # Making sure if we are exporting to Unity, the scale be normal in there
+            "apply_unit_scale": False,
+            "apply_scale_options": 'FBX_SCALE_ALL',
+            "bake_space_transform": True,
+        }
+
+    @staticmethod
+    def get_gltf_image_formats():
+        try:
+            prop = bpy.ops.export_scene.gltf.get_rna_type().properties["export_image_format"]
+            return [item.identifier for item in prop.enum_items]
+        except (AttributeError, KeyError):
+            return []
+
+    @staticmethod
+    def get_gltf_export_settings(configs: Configs):
+        settings = {
+            "export_format": 'GLB' if configs.export_format == 'GLB' else 'GLTF_SEPARATE',
+            # glTF is Y up in meters by spec, the exporter converts like bake_space_transform
+            "export_yup": True,
+            "export_apply": True,
+            "export_draco_mesh_compression_enable": configs.gltf_draco,
+            "export_draco_mesh_compression_level": configs.gltf_draco_level
+        }
+
+        # Older exporters lack WebP, they keep their automatic choice
+        if configs.gltf_image_format in Utils.get_gltf_image_formats():
+            settings["export_image_format"] = configs.gltf_image_format
+        return settings
+
+    @staticmethod
+    def get_export_settings(configs: Configs, export_format=None):
+        # Sent as is to the export workers
+        export_format = export_format or configs.export_format
+        if export_format == 'FBX':
+            options = Utils.get_fbx_export_settings()
+        else:
+            options = Utils.get_gltf_export_settings(configs)
+
+        return {
+            "format": export_format,
+            "extension": Utils.export_extensions[export_format],
+            "options": options,
+            "compare": bool(configs and configs.compare_formats and not export_format == 'FBX')
+        }
+
+    @staticmethod
+    def get_worker_blend_path():
+        # Workers read the file from disk, unsaved changes go to a temp copy
+        if not bpy.data.is_dirty:
+            return bpy.data.filepath, None
+
+        temp_dir = tempfile.mkdtemp(prefix="taper_")
+        blend_path = os.path.join(temp_dir, bpy.path.basename(bpy.data.filepath))
+        with TextureProxies.full_paths():
+            bpy.ops.wm.save_as_mainfile(filepath=blend_path, copy=True)
+
+        return blend_path, temp_dir
+
     @staticmethod
     def ensure_path(folderPath):
         if not os.path.exists(folderPath):
             os.makedirs(folderPath)
 
+    @staticmethod
+    def get_preferences(context):
+        return context.preferences.addons[__name__].preferences
+
     @staticmethod
     def get_substance_painter_path(context):
-        return context.preferences.addons[__name__].preferences.substance_painter_path
+        return Utils.get_preferences(context).substance_painter_path
 
     @staticmethod
     def get_active_collection_name(context):
         return bpy.path.clean_name(context.view_layer.active_layer_collection.name)
 
+    @staticmethod
+    def show_rendered(context, configs: Configs):
+        # Only a 3D viewport has shading, the operators also run from scripts
+        space = context.space_data
+        if not configs.keep_shading and space and space.type == 'VIEW_3D':
+            space.shading.type = 'RENDERED'
 
-class ExportFBXCollectionsOperator(bpy.types.Operator):
-    bl_idname = bl_info["operator_id_prefix"] + ".export_fbx_collections"
-    bl_label = "Export FBX Collections"
-    button_label = "All"
+    @staticmethod
+    def get_target_objects(context, configs: Configs):
+        if configs.batch_scope == 'SELECTED':
+            return list(context.selected_objects)
+        if configs.batch_scope == 'COLLECTION':
+            return list(context.view_layer.active_layer_collection.collection.all_objects)
 
-    def execute(self, context):
-        path, error = Utils.get_export_path(
-            configs=context.scene.taper_configs
-        )
-        if not path == None:
-            bpy.ops.export_scene.fbx(
-                filepath=path,
+        active_obj = context.view_layer.objects.active
+        return [active_obj] if active_obj else []
 
-                # Making sure if we are exporting to Unity, the scale be normal in there
-                apply_unit_scale=False,
-                apply_scale_options='FBX_SCALE_ALL',
-                bake_space_transform=True,
+    @staticmethod
+    def get_target_materials(context, configs: Configs):
+        # Every material once, however many slots and objects share it
+        materials = []
+        seen = set()
+        for obj in Utils.get_target_objects(context, configs):
+            for slot in obj.material_slots:
+                if slot.material and not slot.material.name in seen:
+                    seen.add(slot.material.name)
+                    materials.append(slot.material)
+
+        return materials
 
-                # SCENE_COLLECTION
-                batch_mode='COLLECTION',
-                use_batch_own_dir=False
-            )
-            self.report({'INFO'}, "FBX Exported")
-        else:
-            self.report({'ERROR'}, error)
+    @staticmethod
+    def get_shader_input(node, socket_name):
+        # Blender 4.0 renamed Specular and dropped Subsurface Color from the Principled BSDF
+        socket = node.inputs.get(socket_name)
+        if socket is None:
+            socket = node.inputs.get(Utils.shader_input_aliases.get(socket_name, ""))
+        return socket
 
-        print(error)
-        return {'FINISHED'}
+    @staticmethod
+    def format_size(num_bytes):
+        for unit in ['B', 'KB', 'MB']:
+            if num_bytes < 1024:
+                return "%.1f %s" % (num_bytes, unit)
+            num_bytes /= 1024.0
+        return "%.1f GB" % num_bytes
 
 
-class ExportFBXActiveCollectionOperator(bpy.types.Operator):
-    bl_idname = bl_info["operator_id_prefix"] + ".export_fbx_active_collection"
-    bl_label = "Export Active FBX Collection"
-    button_label = "Active"
+class ImageHeader(object):
 
-    def execute(self, context):
+    # Probed headers keyed by path, dropped when the file stamp changes
+    cache = {}
+    # Channels per PNG color type
+    png_channels = {0: 1, 2: 3, 3: 3, 4: 2, 6: 4}
+    # Bits per EXR pixel type, UINT, HALF and FLOAT
+    exr_depths = {0: 32, 1: 16, 2: 32}
+    # Scene linear colorspace, renamed in Blender 4.0
+    linear_colorspaces = ("Linear Rec.709", "Linear")
 
-        path, error = Utils.get_export_path(
-            configs=context.scene.taper_configs,
-            filename=Utils.get_active_collection_name(context)
-        )
-        if not path == None:
-            bpy.ops.export_scene.fbx(
-                filepath=path,
+    @classmethod
+    def probe(cls, path):
+        # Width, height, bits per channel and channel count read from the header
+        # only, the pixels are decoded when Blender first draws the image
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        cached = cls.cache.get(path)
+        if cached and cached[0] == stamp:
+            return cached[1]
+
+        reader = {
+            '.png': cls.read_png,
+            '.tga': cls.read_tga,
+            '.tif': cls.read_tiff,
+            '.tiff': cls.read_tiff,
+            '.exr': cls.read_exr,
+            '.jpg': cls.read_jpeg,
+            '.jpeg': cls.read_jpeg
+        }.get(os.path.splitext(path)[1].lower())
+
+        header = None
+        if reader and stat.st_size:
+            try:
+                with open(path, 'rb') as f:
+                    header = reader(f)
+            except (OSError, ValueError, struct.error):
+                header = None
+
+        cls.cache[path] = (stamp, header)
+        return header
 
-                # Making sure if we are exporting to Unity, the scale be normal in there
-                apply_unit_scale=False,
-                apply_scale_options='FBX_SCALE_ALL',
-                bake_space_transform=True,
+    @staticmethod
+    def make(width, height, depth, channels, is_float=False):
+        return {
+            "width": width,
+            "height": height,
+            "depth": depth,
+            "channels": channels,
+            "is_float": is_float
+        }
 
-                use_active_collection=True,
-                batch_mode='OFF',
-                use_batch_own_dir=False
-            )
-            self.report({'INFO'}, "FBX Exported")
+    @classmethod
+    def read_png(cls, f):
+        data = f.read(26)
+        if not data[:8] == b"\x89PNG\r\n\x1a\n" or not data[12:16] == b"IHDR":
+            return None
+
+        width, height, depth, color_type = struct.unpack(">IIBB", data[16:26])
+        return cls.make(width, height, depth, cls.png_channels.get(color_type, 4))
+
+    @classmethod
+    def read_tga(cls, f):
+        data = f.read(18)
+        if len(data) < 18:
+            return None
+
+        image_type = data[2]
+        width, height, pixel_depth, descriptor = struct.unpack("<HHBB", data[12:18])
+        if not image_type in (1, 2, 3, 9, 10, 11):
+            return None
+
+        alpha = descriptor & 0x0f
+        if image_type in (1, 9):
+            channels = 4 if alpha else 3
+        elif image_type in (3, 11):
+            channels = 1
         else:
-            self.report({'ERROR'}, error)
-        return {'FINISHED'}
+            channels = 4 if alpha or pixel_depth == 32 else 3
+        return cls.make(width, height, 8, channels)
 
+    @classmethod
+    def read_jpeg(cls, f):
+        # Start of frame markers can sit behind large EXIF blocks, map the file
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if not data[:2] == b"\xff\xd8":
+                return None
+
+            offset = 2
+            while offset + 4 <= len(data):
+                if not data[offset] == 0xff:
+                    return None
+                marker = data[offset + 1]
+                if marker == 0xff:
+                    offset += 1
+                    continue
+
+                length = struct.unpack_from(">H", data, offset + 2)[0]
+                if 0xc0 <= marker <= 0xcf and not marker in (0xc4, 0xc8, 0xcc):
+                    depth, height, width, channels = struct.unpack_from(">BHHB", data, offset + 4)
+                    return cls.make(width, height, depth, channels)
+                offset += 2 + length
+
+        return None
 
-class AutoNameUnwrapMaterialOperator(bpy.types.Operator):
-    bl_idname = bl_info["operator_id_prefix"] + ".name_unwrap_auto"
-    bl_label = "Auto Name Unwrap Material"
-    button_label = "Auto UV, Mat, Normal"
+    @classmethod
+    def read_tiff(cls, f):
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            order = {b"II": "<", b"MM": ">"}.get(data[:2])
+            if not order or not struct.unpack_from(order + "H", data, 2)[0] == 42:
+                return None
+
+            # Only the first directory, it describes the full resolution image
+            ifd = struct.unpack_from(order + "I", data, 4)[0]
+            count = struct.unpack_from(order + "H", data, ifd)[0]
+            sizes = {1: "B", 3: "H", 4: "I"}
+
+            tags = {}
+            for i in range(count):
+                tag, field, num, value = struct.unpack_from(order + "HHI4s", data, ifd + 2 + i * 12)
+                fmt = sizes.get(field)
+                if not fmt:
+                    continue
+                # Values that do not fit in the entry are stored at an offset
+                values_size = struct.calcsize(fmt) * num
+                if values_size <= 4:
+                    source = value
+                else:
+                    start = struct.unpack(order + "I", value)[0]
+                    source = data[start:start + values_size]
+                tags[tag] = struct.unpack_from(order + fmt * num, source)
 
-    def execute(self, context):
-        active_obj = bpy.context.view_layer.objects.active
+            channels = tags.get(277, (1,))[0]
+            depth = tags.get(258, (1,))[0]
+            sample_format = tags.get(339, (1,))[0]
+            if not 256 in tags or not 257 in tags:
+                raise ValueError("TIFF without image width or length")
+            return cls.make(tags[256][0], tags[257][0], depth, channels, sample_format == 3)
 
-        # add a material if there isnt any
-        if len(active_obj.data.materials) == 0:
-            mat = bpy.data.materials.new(
-                name=Utils.get_active_collection_name(context))
-            active_obj.data.materials.append(mat)
+    @classmethod
+    def read_exr(cls, f):
+        if not f.read(4) == b"\x76\x2f\x31\x01":
+            return None
+        f.read(4)
+
+        # Attributes are name, type, size and value until an empty name
+        data = f.read(65536)
+        offset = 0
+        channels = None
+        window = None
+        while offset < len(data) and data[offset]:
+            name_end = data.index(b"\0", offset)
+            type_end = data.index(b"\0", name_end + 1)
+            name = data[offset:name_end]
+            size = struct.unpack_from("<i", data, type_end + 1)[0]
+            value = data[type_end + 5:type_end + 5 + size]
+            offset = type_end + 5 + size
+
+            if name == b"channels":
+                channels = []
+                position = 0
+                while position < len(value) and value[position]:
+                    channel_end = value.index(b"\0", position)
+                    channels.append(struct.unpack_from("<i", value, channel_end + 1)[0])
+                    position = channel_end + 17
+            elif name == b"dataWindow":
+                window = struct.unpack_from("<iiii", value)
+
+        if not channels or not window:
+            return None
+
+        return cls.make(
+            window[2] - window[0] + 1,
+            window[3] - window[1] + 1,
+            max(cls.exr_depths.get(pixel_type, 32) for pixel_type in channels),
+            len(channels),
+            True
+        )
 
-        bpy.ops.object.mode_set(mode='EDIT')
+    @staticmethod
+    def set_value(owner, name, value):
+        # Image settings free the loaded pixels when assigned, even with the same value
+        if not getattr(owner, name) == value:
+            setattr(owner, name, value)
 
-        # Recalculate normal
-        bpy.ops.mesh.select_all(action='SELECT')
-        bpy.ops.mesh.normals_make_consistent(inside=False)
+    @classmethod
+    def get_colorspace(cls, image, header, is_color):
+        if not is_color:
+            return 'Non-Color'
 
-        bpy.ops.mesh.select_all(action='DESELECT')
+        # Float color maps hold linear values, 8 and 16 bit ones keep the sRGB Blender picked
+        if header and header["is_float"]:
+            names = image.colorspace_settings.bl_rna.properties["name"].enum_items.keys()
+            return next((name for name in cls.linear_colorspaces if name in names), None)
+        return None
 
-        for idx, mat in enumerate(active_obj.data.materials):
-            bpy.context.object.active_material_index = idx
-            bpy.ops.object.material_slot_select()
-            # Smart UV project
-            bpy.ops.uv.smart_project()
-            bpy.ops.object.material_slot_deselect()
+    @classmethod
+    def configure(cls, image, is_color):
+        path = ImageManifest.get_image_path(image)
+        tiles = UDIMTiles.get_tile_paths(path)
+        header = cls.probe(tiles[0][1] if tiles else path)
 
-        bpy.ops.object.editmode_toggle()
+        colorspace = cls.get_colorspace(image, header, is_color)
+        if colorspace:
+            cls.set_value(image.colorspace_settings, "name", colorspace)
 
-        return {'FINISHED'}
+        if not header:
+            return
 
+        # Half float EXRs lose nothing in a half float buffer, 16 bit integer maps would
+        if hasattr(image, "use_half_precision"):
+            cls.set_value(image, "use_half_precision", header["is_float"] and header["depth"] <= 16)
 
-class FlipNormalOperator(bpy.types.Operator):
-    bl_idname = bl_info["operator_id_prefix"] + ".flip_normal"
-    bl_label = "Flip Normal"
-    button_label = "Flip Normal"
+        # Data maps never want their RGB premultiplied by alpha
+        if not is_color:
+            cls.set_value(image, "alpha_mode", 'CHANNEL_PACKED' if header["channels"] in (2, 4) else 'NONE')
 
-    def execute(self, context):
-        bpy.ops.object.mode_set(mode='EDIT')
 
-        # Flip normal
-        bpy.ops.mesh.select_all(action='SELECT')
-        bpy.ops.mesh.flip_normals()
-        bpy.ops.mesh.select_all(action='DESELECT')
-        bpy.ops.object.editmode_toggle()
+class UDIMTiles(object):
 
-        return {'FINISHED'}
+    # Painter writes one file per tile, Name.1001.png, Name.1002.png, ...
+    token = "<UDIM>"
+    pattern = re.compile(r'^(.*)\.(1\d{3})$')
+    FileStamp = namedtuple("FileStamp", "st_mtime st_size")
 
+    @classmethod
+    def split(cls, stem):
+        match = cls.pattern.match(stem)
+        if match:
+            return match.group(1), int(match.group(2))
+        return stem, None
 
-class AutoCenterOperator(bpy.types.Operator):
-    bl_idname = bl_info["operator_id_prefix"] + ".center_auto"
-    bl_label = "Auto Center"
-    button_label = "Auto Center"
+    @classmethod
+    def to_token(cls, path):
+        folder, name = os.path.split(path)
+        stem, extension = os.path.splitext(name)
+        base, tile = cls.split(stem)
+        if tile is None:
+            return path
+        return os.path.join(folder, base + "." + cls.token + extension)
 
-    def execute(self, context):
-        active_obj = bpy.context.view_layer.objects.active
+    @classmethod
+    def get_tile_paths(cls, path):
+        # Existing tile files of a <UDIM> path as (number, path), None for plain paths
+        folder, name = os.path.split(path)
+        if not cls.token in name:
+            return None
 
-        bpy.ops.object.origin_set(type='ORIGIN_GEOMETRY', center='MEDIAN')
-        bpy.context.object.location[0] = 0
-        bpy.context.object.location[1] = 0
-        bpy.context.object.location[2] = 0
+        prefix, suffix = name.split(cls.token, 1)
+        pattern = re.compile(re.escape(prefix) + r'(1\d{3})' + re.escape(suffix) + '$')
 
-        return {'FINISHED'}
+        tiles = []
+        with os.scandir(folder or '.') as entries:
+            for entry in entries:
+                match = pattern.match(entry.name)
+                if match:
+                    tiles.append((int(match.group(1)), entry.path))
 
+        return sorted(tiles)
 
-class TaperExportPanel(bpy.types.Panel):
-    bl_idname = bl_info["panel_id_name_export"]
-    bl_label = bl_info["panel_label_export"]
-    bl_category = bl_info["name"]
-    bl_space_type = "VIEW_3D"
-    bl_region_type = "UI"
+    @classmethod
+    def get_stat(cls, path):
+        # Tiled images are stamped with their newest tile and the size of all tiles
+        tiles = cls.get_tile_paths(path)
+        if tiles is None:
+            return os.stat(path)
+        if not tiles:
+            raise OSError("No tiles found for " + path)
+
+        stats = [os.stat(tile_path) for number, tile_path in tiles]
+        return cls.FileStamp(
+            max(stat.st_mtime for stat in stats),
+            sum(stat.st_size for stat in stats)
+        )
 
-    def draw(self, context):
-        layout = self.layout
-        scene = context.scene
-        configs = scene.taper_configs
+    @staticmethod
+    def add_tiles(image, numbers):
+        existing = set(tile.number for tile in image.tiles)
+        for number in numbers:
+            if not number in existing:
+                image.tiles.new(tile_number=number)
 
-        if not bpy.data.is_saved:
-            layout.label(text="File not saved")
+    @classmethod
+    def load(cls, path):
+        # One tiled datablock holds every tile, loaded from the first tile file
+        tiles = cls.get_tile_paths(path)
+        if not tiles:
+            raise OSError("No tiles found for " + path)
 
-        layout.label(text="Export Collection to FBX")
-        col = layout.column(align=True)
-        col.operator(
-            ExportFBXCollectionsOperator.bl_idname,
-            text=ExportFBXCollectionsOperator.button_label
-        )
-        col.operator(
-            ExportFBXActiveCollectionOperator.bl_idname,
-            text=ExportFBXActiveCollectionOperator.button_label
-        )
+        image = bpy.data.images.load(tiles[0][1], check_existing=True)
+        image.source = 'TILED'
+        cls.add_tiles(image, [number for number, tile_path in tiles])
+        return image
 
-        layout.prop(configs, "export_to_folder")
-        if (configs.export_to_folder):
-            layout.prop(configs, "folder_export_path", text="")
 
-        layout.label(text="Utils")
-        col = layout.column(align=True)
-        col.operator(
-            FlipNormalOperator.bl_idname,
-            text=FlipNormalOperator.button_label
-        )
-        col.operator(
-            AutoNameUnwrapMaterialOperator.bl_idname,
-            text=AutoNameUnwrapMaterialOperator.button_label
-        )
-        col.operator(
-            AutoCenterOperator.bl_idname,
-            text=AutoCenterOperator.button_label
-        )
+class TextureIndex(object):
+
+    # Scanned texture folders keyed by normalized path, rescanned only when
+    # the folder mtime changes
+    cache = {}
+    templates = None
+    # Accepted formats, on a tie the higher bit depth formats come first
+    extensions = ['.exr', '.tif', '.tiff', '.png', '.tga', '.jpg', '.jpeg']
+
+    def __init__(self, texture_export_path):
+        self.path = texture_export_path
+        self.mtime = None
+        self.materials = {}
+        self.file_counts = {}
+
+    @classmethod
+    @Profiler.timed("texture_index")
+    def load(cls, texture_export_path):
+        key = os.path.normcase(os.path.abspath(texture_export_path))
+
+        index = cls.cache.get(key)
+        if index is None:
+            index = cls.cache[key] = cls(texture_export_path)
+
+        index.refresh()
+        return index
+
+    @classmethod
+    def get_templates(cls):
+        if cls.templates is None:
+            operator = SubstancePullTexturesOperator
+
+            # One pattern per socket, each tag is an optional lookahead group so a
+            # single match tells which tag (and so which priority) hit first
+            cls.templates = [
+                (
+                    socket[0],
+                    re.compile(''.join(
+                        '(?:(?=.*?(%s)))?' % re.escape(tag) for tag in socket[1]
+                    ))
+                )
+                for socket in operator.socketnames
+            ]
+            cls.extra_templates = {
+                'Roughness': ('IS_GLOSS', cls.compile_tags(operator.gloss_tag)),
+                'Normal': ('IS_BUMP', cls.compile_tags(operator.bump_tag))
+            }
+
+        return cls.templates
+
+    @staticmethod
+    def compile_tags(tags: str):
+        return re.compile('|'.join(re.escape(tag) for tag in tags.split(' ')))
+
+    def refresh(self):
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime != self.mtime:
+            self.scan()
+            self.mtime = mtime
+
+    def scan(self):
+        templates = self.get_templates()
+        ranked = {}
+        file_counts = {}
+        udims = {}
+
+        with os.scandir(self.path) as entries:
+            for order, entry in enumerate(entries):
+                filename = entry.name
+                stem, extension = os.path.splitext(filename)
+                extension = extension.lower()
+                if not extension in self.extensions or not entry.is_file():
+                    continue
+                priority = (self.extensions.index(extension), order)
+
+                # Later tiles only extend the tile list of the first one found
+                stem, tile = UDIMTiles.split(stem)
+                tiles = None
+                if tile is not None:
+                    tiles = udims.get(stem + extension)
+                    if tiles is not None:
+                        tiles.append(tile)
+                        continue
+                    tiles = udims[stem + extension] = [tile]
+                    filename = stem + "." + UDIMTiles.token + extension
+
+                # Files are named either Material_Channel or Prefix_Material_Channel
+                filenames = stem.split('_')
+                owners = [(filenames[0], filenames[1:])]
+                if len(filenames) > 1 and not filenames[1] == filenames[0]:
+                    owners.append((filenames[1], filenames[2:]))
+
+                for material_name, channel in owners:
+                    file_counts[material_name] = file_counts.get(material_name, 0) + 1
+
+                    channel = '_'.join(channel).lower()
+                    if not channel:
+                        continue
+
+                    sockets = ranked.setdefault(material_name, {})
+                    for socket_name, template in templates:
+                        groups = template.match(channel).groups()
+                        rank = next(
+                            (i for i, tag in enumerate(groups) if tag), None)
+                        if rank is None:
+                            continue
+
+                        best = sockets.get(socket_name)
+                        if best and best[0] <= (rank, priority):
+                            continue
+
+                        sockets[socket_name] = (
+                            (rank, priority),
+                            {
+                                'name': filename,
+                                'extra': self.get_extra(socket_name, channel),
+                                'tiles': tiles
+                            }
+                        )
+
+        for tiles in udims.values():
+            tiles.sort()
+
+        self.materials = {
+            material_name: {
+                socket_name: match for socket_name, (rank, match) in sockets.items()
+            }
+            for material_name, sockets in ranked.items()
+        }
+        self.file_counts = file_counts
+
+    def get_extra(self, socket_name, channel):
+        extra = self.extra_templates.get(socket_name)
+        if extra and extra[1].search(channel):
+            return extra[0]
+        return None
+
+    def get(self, material_name, socket_name):
+        return self.materials.get(material_name, {}).get(socket_name)
+
+    def count(self, material_name):
+        return self.file_counts.get(material_name, 0)
+
+
+class ImageManifest(object):
+
+    # Persisted on each image datablock, so it is saved along with the .blend
+    key = "taper_manifest"
+
+    @staticmethod
+    def get_image_path(image):
+        # An image showing its viewport proxy still tracks the full resolution file
+        path = TextureProxies.get_full_path(image)
+        if path:
+            return path
+
+        path = bpy.path.abspath(image.filepath, library=image.library)
+        if image.source == 'TILED':
+            path = UDIMTiles.to_token(path)
+        return path
+
+    @classmethod
+    def read(cls, image):
+        entry = image.get(cls.key)
+        return entry.to_dict() if entry else None
+
+    @classmethod
+    def write(cls, image, path, stat=None, file_hash=None, use_hash=False):
+        if stat is None:
+            stat = UDIMTiles.get_stat(path)
+        if file_hash is None and use_hash and not UDIMTiles.token in path:
+            file_hash = Utils.get_file_hash(path)
+
+        # Stored as doubles, ID property ints are only 32 bit
+        image[cls.key] = {
+            "path": path,
+            "mtime": stat.st_mtime,
+            "size": float(stat.st_size),
+            "hash": file_hash or ""
+        }
+
+    @classmethod
+    def check(cls, image, path, use_hash=False):
+        try:
+            stat = UDIMTiles.get_stat(path)
+        except OSError:
+            return 'MISSING'
+
+        entry = cls.read(image)
+        if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+            return 'UNCHANGED'
+
+        # Rewritten with the same content, only the stamp needs refreshing
+        if use_hash and entry and entry["hash"]:
+            file_hash = Utils.get_file_hash(path)
+            if file_hash == entry["hash"]:
+                cls.write(image, path, stat, file_hash)
+                return 'UNCHANGED'
+
+        return 'CHANGED'
+
+    @classmethod
+    def reload(cls, image, path, use_hash=False):
+        # The proxy is stale now, show the new file until the next pull rebuilds it
+        TextureProxies.set_active(image, False)
+        if image.source == 'TILED':
+            UDIMTiles.add_tiles(image, [number for number, tile_path in UDIMTiles.get_tile_paths(path)])
+        image.reload()
+        cls.write(image, path, use_hash=use_hash)
+
+
+class ImageCache(object):
+
+    def __init__(self, use_hash=False):
+        self.images = None
+        self.use_hash = use_hash
+        self.purged = 0
+        self.reclaimed = 0
+
+    @staticmethod
+    def normalize_path(path, library=None):
+        return os.path.normcase(os.path.normpath(bpy.path.abspath(path, library=library)))
+
+    @staticmethod
+    def get_image_bytes(image):
+        # Only decoded images hold a pixel buffer
+        if not image.has_data:
+            return 0
+        width, height = image.size
+        return width * height * image.channels * (4 if image.is_float else 1)
+
+    def build(self):
+        self.images = {}
+        for image in bpy.data.images:
+            if image.source in ['FILE', 'TILED'] and image.filepath and not image.library:
+                key = self.normalize_path(ImageManifest.get_image_path(image))
+                self.images.setdefault(key, []).append(image)
+
+    def dedupe(self, images):
+        # Keep the most used datablock and remap the copies onto it
+        keep = max(images, key=lambda image: image.users)
+        for image in images:
+            if image == keep:
+                continue
+            self.reclaimed += self.get_image_bytes(image)
+            self.purged += 1
+            image.user_remap(keep)
+            bpy.data.images.remove(image)
+
+        images[:] = [keep]
+        return keep
+
+    def purge(self):
+        if self.images is None:
+            self.build()
+
+        for images in self.images.values():
+            if len(images) > 1:
+                self.dedupe(images)
+
+    @Profiler.timed("image_load")
+    def load(self, path):
+        if self.images is None:
+            self.build()
+
+        key = self.normalize_path(path)
+
+        images = self.images.get(key)
+        if images:
+            image = self.dedupe(images)
+
+            # Reload only when a decoded buffer is older than the file on disk
+            if ImageManifest.check(image, path, self.use_hash) == 'CHANGED':
+                if image.has_data:
+                    ImageManifest.reload(image, path, self.use_hash)
+                else:
+                    ImageManifest.write(image, path, use_hash=self.use_hash)
+            return image
+
+        if UDIMTiles.token in path:
+            image = UDIMTiles.load(path)
+        else:
+            image = bpy.data.images.load(path, check_existing=True)
+        ImageManifest.write(image, path, use_hash=self.use_hash)
+        self.images[key] = [image]
+        return image
+
+    def get_report(self):
+        if not self.purged:
+            return None
+        return "Reclaimed %s from %d duplicate images" % (
+            Utils.format_size(self.reclaimed), self.purged)
+
+
+class ChannelPacker(object):
+
+    # Grayscale sockets merged into the R, G, B and A channels of one image
+    layout = ['Metallic', 'Roughness', 'Specular', 'Displacement']
+    # Height steps visibly at 8 bit, float sources stay in their own image
+    byte_only = ['Displacement']
+    folder = ".taper_cache"
+    key = "taper_packed"
+    version = 1
+
+    @classmethod
+    def get_paths(cls, texture_export_path, material_name):
+        base = os.path.join(texture_export_path, cls.folder, material_name + "_Packed")
+        return base + ".png", base + ".json"
+
+    @staticmethod
+    def get_stamps(texture_export_path, index, material_name, sockets):
+        stamps = {}
+        for socket_name in sockets:
+            match = index.get(material_name, socket_name)
+            if match and not match['tiles']:
+                stat = os.stat(os.path.join(texture_export_path, match['name']))
+                stamps[socket_name] = [match['name'], stat.st_mtime_ns, stat.st_size]
+        return stamps
+
+    @staticmethod
+    def read_entry(entry_path):
+        try:
+            with open(entry_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def get_channel(path):
+        # Loaded on the side so images already in the file keep their settings
+        image = bpy.data.images.load(path, check_existing=False)
+        try:
+            image.colorspace_settings.name = 'Non-Color'
+            pixels = np.empty(len(image.pixels), dtype=np.float32)
+            image.pixels.foreach_get(pixels)
+            return pixels.reshape(-1, image.channels)[:, 0], tuple(image.size), image.is_float
+        finally:
+            bpy.data.images.remove(image)
+
+    @classmethod
+    def build(cls, texture_export_path, stamps, image_path):
+        packed = None
+        size = None
+        channels = {}
+
+        for channel, socket_name in enumerate(cls.layout):
+            if not socket_name in stamps:
+                continue
+
+            # The header tells float and mismatched maps apart without decoding them
+            path = os.path.join(texture_export_path, stamps[socket_name][0])
+            header = ImageHeader.probe(path)
+            if header:
+                if header["is_float"] and socket_name in cls.byte_only:
+                    continue
+                if size and not (header["width"], header["height"]) == size:
+                    continue
+
+            values, source_size, is_float = cls.get_channel(path)
+            if is_float and socket_name in cls.byte_only:
+                continue
+
+            if packed is None:
+                size = source_size
+                packed = np.zeros((size[0] * size[1], 4), dtype=np.float32)
+                packed[:, 3] = 1.0
+            elif not source_size == size:
+                continue
+
+            packed[:, channel] = values
+            channels[socket_name] = channel
+
+        if len(channels) < 2:
+            return {}
+
+        image = bpy.data.images.new("Taper Packed", size[0], size[1], alpha=True)
+        try:
+            image.alpha_mode = 'CHANNEL_PACKED'
+            image.colorspace_settings.name = 'Non-Color'
+            image.pixels.foreach_set(packed.ravel())
+            image.filepath_raw = image_path
+            image.file_format = 'PNG'
+            image.save()
+        finally:
+            bpy.data.images.remove(image)
+
+        return channels
+
+    @classmethod
+    def get_sockets(cls, sockets=None):
+        return [s for s in cls.layout if sockets is None or s in sockets]
+
+    @classmethod
+    def update(cls, texture_export_path, material_name, index, sockets=None):
+        sockets = cls.get_sockets(sockets)
+        stamps = cls.get_stamps(texture_export_path, index, material_name, sockets)
+        if len(stamps) < 2:
+            return None, {}
+
+        image_path, entry_path = cls.get_paths(texture_export_path, material_name)
+        entry = cls.read_entry(entry_path)
+
+        # Repack only when a source file changed since the cached image was written
+        if not (entry and entry["version"] == cls.version and entry["sources"] == stamps
+                and os.path.isfile(image_path)):
+            Utils.ensure_path(os.path.dirname(image_path))
+            entry = {
+                "version": cls.version,
+                "sources": stamps,
+                "channels": cls.build(texture_export_path, stamps, image_path)
+            }
+
+            temp_path = entry_path + ".tmp"
+            with open(temp_path, 'w') as f:
+                json.dump(entry, f)
+            os.replace(temp_path, entry_path)
+
+        if not entry["channels"]:
+            return None, {}
+        return image_path, entry["channels"]
+
+    @classmethod
+    @Profiler.timed("channel_pack")
+    def pack(cls, texture_export_path, material_name, index, cache, sockets=None):
+        image_path, channels = cls.update(
+            texture_export_path, material_name, index, sockets)
+        if not image_path:
+            return None, {}
+
+        image = cache.load(image_path)
+        image.alpha_mode = 'CHANNEL_PACKED'
+        image.colorspace_settings.name = 'Non-Color'
+        image[cls.key] = {
+            "path": texture_export_path,
+            "material": material_name,
+            "sockets": ",".join(cls.get_sockets(sockets))
+        }
+        return image, channels
+
+    @classmethod
+    def refresh(cls, image):
+        # Rewrites the packed file when its sources changed, the caller reloads it
+        entry = image.get(cls.key)
+        if entry and os.path.isdir(entry["path"]):
+            index = TextureIndex.load(entry["path"])
+            cls.update(entry["path"], entry["material"], index, entry["sockets"].split(","))
+
+
+class TextureStats(object):
+
+    # Per folder results, persisted next to the packed images
+    cache = {}
+    file_name = "stats.json"
+    version = 2
+    # Largest side of the pixel sample the statistics are computed on
+    sample_size = 256
+    # Channel spread still treated as one flat value, about two 8 bit steps
+    tolerance = 2.0 / 255.0
+    flat_normal = (0.5, 0.5, 1.0)
+
+    def __init__(self, texture_export_path):
+        self.path = texture_export_path
+        self.entry_path = os.path.join(texture_export_path, ChannelPacker.folder, self.file_name)
+        self.files = {}
+        self.dirty = False
+
+        try:
+            with open(self.entry_path) as f:
+                data = json.load(f)
+            if data.get("version") == self.version:
+                self.files = data["files"]
+        except (OSError, ValueError):
+            pass
+
+    @classmethod
+    def load(cls, texture_export_path):
+        key = os.path.normcase(os.path.abspath(texture_export_path))
+
+        stats = cls.cache.get(key)
+        if stats is None:
+            stats = cls.cache[key] = cls(texture_export_path)
+        return stats
+
+    @classmethod
+    def analyze(cls, path):
+        image = bpy.data.images.load(path, check_existing=False)
+        try:
+            image.colorspace_settings.name = 'Non-Color'
+
+            # Scaled down in place, this datablock is ours alone, so only the
+            # small sample is copied out instead of the full float buffer
+            width, height = image.size
+            scale = min(1.0, cls.sample_size / max(width, height, 1))
+            if scale < 1.0:
+                image.scale(max(1, round(width * scale)), max(1, round(height * scale)))
+                width, height = image.size
+
+            pixels = np.empty(width * height * image.channels, dtype=np.float32)
+            image.pixels.foreach_get(pixels)
+            sample = pixels.reshape(-1, image.channels)[:, :3]
+
+            return {
+                "is_float": bool(image.is_float),
+                "min": sample.min(axis=0).tolist(),
+                "max": sample.max(axis=0).tolist(),
+                "mean": sample.mean(axis=0).tolist()
+            }
+        finally:
+            bpy.data.images.remove(image)
+
+    @Profiler.timed("texture_stats")
+    def get(self, file_name):
+        stat = os.stat(os.path.join(self.path, file_name))
+        stamp = [stat.st_mtime_ns, stat.st_size]
+
+        entry = self.files.get(file_name)
+        if not entry or not entry["stamp"] == stamp:
+            entry = self.analyze(os.path.join(self.path, file_name))
+            entry["stamp"] = stamp
+            self.files[file_name] = entry
+            self.dirty = True
+
+        return entry
+
+    def is_constant(self, entry):
+        return all(high - low <= self.tolerance for low, high in zip(entry["min"], entry["max"]))
+
+    @staticmethod
+    def to_linear(value):
+        if value <= 0.04045:
+            return value / 12.92
+        return ((value + 0.055) / 1.055) ** 2.4
+
+    def get_value(self, socket_name, extra, entry):
+        mean = entry["mean"]
+
+        if socket_name in ['Base Color', 'Subsurface Color']:
+            # Byte images hold sRGB values, the socket expects linear
+            color = mean if entry["is_float"] else [self.to_linear(c) for c in mean]
+            return tuple(color[:3]) + (1.0,) if len(color) >= 3 else (color[0],) * 3 + (1.0,)
+
+        if socket_name == 'Roughness' and extra == 'IS_GLOSS':
+            return 1.0 - mean[0]
+
+        return mean[0]
+
+    def get_constants(self, index, material_name, sockets):
+        # Returns socket default values, None for maps that can simply be left out
+        constants = {}
+
+        for socket_name in sockets:
+            match = index.get(material_name, socket_name)
+            if not match or match['tiles']:
+                continue
+
+            entry = self.get(match['name'])
+            if not self.is_constant(entry):
+                continue
+
+            if socket_name == 'Normal':
+                # A flat bump map or an untilted normal map changes nothing
+                is_flat = match['extra'] == 'IS_BUMP' or all(
+                    abs(value - neutral) <= self.tolerance
+                    for value, neutral in zip(entry["mean"], self.flat_normal))
+                if is_flat:
+                    constants[socket_name] = None
+            elif socket_name == 'Displacement':
+                constants[socket_name] = None
+            else:
+                constants[socket_name] = self.get_value(socket_name, match['extra'], entry)
+
+        return constants
+
+    def save(self):
+        if not self.dirty:
+            return
+
+        Utils.ensure_path(os.path.dirname(self.entry_path))
+        temp_path = self.entry_path + ".tmp"
+        with open(temp_path, 'w') as f:
+            json.dump({"version": self.version, "files": self.files}, f)
+        os.replace(temp_path, self.entry_path)
+        self.dirty = False
+
+
+def texture_proxy_tick():
+    return TextureProxies.tick()
+
+
+def texture_proxy_resume_tick():
+    return TextureProxies.resume_after_render()
+
+
+@persistent
+def texture_proxy_render_init(scene):
+    # The render has already started, reloading images here is not safe
+    if any(image.get(TextureProxies.key, {}).get("active") for image in bpy.data.images):
+        print("Taper: rendering with texture proxies, use Render Full Textures for full resolution")
+
+
+@persistent
+def texture_proxy_render_done(scene):
+    # Proxies come back from the main thread once the render job let go of the images
+    if TextureProxies.rendering and not bpy.app.timers.is_registered(texture_proxy_resume_tick):
+        bpy.app.timers.register(texture_proxy_resume_tick, first_interval=TextureProxies.interval)
+
+
+@persistent
+def texture_proxy_save_pre(dummy):
+    TextureProxies.saved = TextureProxies.release()
+
+
+@persistent
+def texture_proxy_save_post(dummy):
+    TextureProxies.resume(TextureProxies.saved)
+    TextureProxies.saved = []
+
+
+@persistent
+def texture_proxy_load_post(dummy):
+    # Files are saved with the full paths, background processes keep them
+    if not bpy.app.background and bpy.context.scene and bpy.context.scene.taper_configs.use_proxies:
+        TextureProxies.swap_all(True)
+
+
+class TextureProxies(object):
+
+    # Stored on each image as {full, proxy, active}, the image filepath points
+    # at the proxy while it is active
+    key = "taper_proxy"
+    folder = "proxies"
+    interval = 0.2
+
+    pool = None
+    pending = {}
+    rendering = False
+    saved = []
+
+    @classmethod
+    def get_proxy_path(cls, path, size):
+        return os.path.join(os.path.dirname(path), cls.folder, str(size), os.path.basename(path))
+
+    @staticmethod
+    def is_fresh(path, proxy_path):
+        try:
+            return os.stat(proxy_path).st_mtime >= os.stat(path).st_mtime
+        except OSError:
+            return False
+
+    @classmethod
+    def get_full_path(cls, image):
+        entry = image.get(cls.key)
+        return entry["full"] if entry else None
+
+    @classmethod
+    def set_active(cls, image, active):
+        entry = image.get(cls.key)
+        if not entry or entry["active"] == int(active):
+            return
+
+        # Assigning the path reloads the image from the new file, the original
+        # path string is restored so relative paths stay relative
+        image.filepath = entry["proxy"] if active else entry.get("original", entry["full"])
+        entry["active"] = int(active)
+
+    @classmethod
+    def release(cls):
+        # Only the stored path changes, the loaded pixels stay and nothing reloads
+        names = []
+        for image in bpy.data.images:
+            entry = image.get(cls.key)
+            if entry and entry["active"]:
+                image.filepath_raw = entry.get("original", entry["full"])
+                entry["active"] = 0
+                names.append(image.name)
+        return names
+
+    @classmethod
+    def resume(cls, names):
+        for name in names:
+            image = bpy.data.images.get(name)
+            entry = image.get(cls.key) if image else None
+            if entry:
+                image.filepath_raw = entry["proxy"]
+                entry["active"] = 1
+
+    @classmethod
+    @contextmanager
+    def full_paths(cls):
+        # Saved copies and exports see the full resolution files
+        names = cls.release()
+        try:
+            yield
+        finally:
+            cls.resume(names)
+
+    @classmethod
+    def resume_after_render(cls):
+        if hasattr(bpy.app, "is_job_running") and bpy.app.is_job_running('RENDER'):
+            return cls.interval
+
+        cls.rendering = False
+        if bpy.context.scene.taper_configs.use_proxies:
+            cls.swap_all(True)
+        return None
+
+    @classmethod
+    def swap_all(cls, active):
+        for image in bpy.data.images:
+            entry = image.get(cls.key)
+            if entry and (not active or cls.is_fresh(entry["full"], entry["proxy"])):
+                cls.set_active(image, active)
+
+    @classmethod
+    def request(cls, images, size, max_workers):
+        cls.cancel()
+
+        stale = {}
+        for image in images:
+            if not image.source == 'FILE' or image.packed_file or image.library:
+                continue
+
+            path = ImageManifest.get_image_path(image)
+            proxy_path = cls.get_proxy_path(path, size)
+
+            entry = image.get(cls.key)
+            if entry and not entry["proxy"] == proxy_path:
+                cls.set_active(image, False)
+                entry = None
+            if not entry:
+                image[cls.key] = {
+                    "full": path, "proxy": proxy_path, "active": 0, "original": image.filepath}
+
+            if cls.is_fresh(path, proxy_path):
+                cls.set_active(image, True)
+            else:
+                cls.set_active(image, False)
+                stale[path] = proxy_path
+                cls.pending.setdefault(proxy_path, []).append(image.name)
+
+        if not stale:
+            return 0
+
+        # Largest files first, spread over the workers by size on disk
+        shards = WorkerPool.split_shards(
+            [(os.path.getsize(path), path) for path in stale], max_workers)
+        workers = [
+            BackgroundWorker(
+                "build_proxies",
+                {"size": size, "files": [[path, stale[path]] for path in shard]},
+                name="%d proxies" % len(shard)
+            )
+            for shard in shards
+        ]
+
+        cls.pool = WorkerPool(workers, max_workers)
+        bpy.app.timers.register(texture_proxy_tick, first_interval=cls.interval)
+        return len(stale)
+
+    @classmethod
+    def tick(cls):
+        if cls.pool is None:
+            return None
+        if not cls.pool.poll():
+            return cls.interval
+
+        for worker in cls.pool.workers:
+            for proxy_path in worker.result or []:
+                for name in cls.pending.get(proxy_path, ()):
+                    image = bpy.data.images.get(name)
+                    if image and not cls.rendering:
+                        cls.set_active(image, True)
+
+        for name, error in cls.pool.get_errors():
+            print("Proxy worker %s failed:\n%s" % (name, error))
+
+        cls.pool = None
+        cls.pending = {}
+        return None
+
+    @classmethod
+    def cancel(cls):
+        if bpy.app.timers.is_registered(texture_proxy_tick):
+            bpy.app.timers.unregister(texture_proxy_tick)
+        if cls.pool:
+            cls.pool.cancel()
+
+        cls.pool = None
+        cls.pending = {}
+
+    @staticmethod
+    def build_proxies_job(payload):
+        size = payload["size"]
+        built = []
+
+        for path, proxy_path in payload["files"]:
+            Utils.ensure_path(os.path.dirname(proxy_path))
+
+            image = bpy.data.images.load(path)
+            width, height = image.size
+            scale = size / float(max(width, height, 1))
+
+            # Small maps are copied so every pulled image has a proxy
+            if scale < 1.0:
+                image.scale(max(1, int(width * scale)), max(1, int(height * scale)))
+                image.filepath_raw = proxy_path
+                image.save()
+            else:
+                shutil.copyfile(path, proxy_path)
+
+            bpy.data.images.remove(image)
+            built.append(proxy_path)
+
+        return built
+
+
+def live_sync_tick():
+    return LiveSync.tick()
+
+
+@persistent
+def live_sync_load_post(dummy):
+    LiveSync.stop()
+
+    configs = bpy.context.scene.taper_configs
+    if configs.live_sync and bpy.data.is_saved:
+        LiveSync.start(Utils.get_textures_export_path(bpy.context, configs))
+
+
+class LiveSync(object):
+
+    interval = 0.5
+    busy_interval = 0.01
+    # Seconds of work allowed per timer tick, the rest continues next tick
+    budget = 0.008
+
+    path = None
+    scanner = None
+    scanned = {}
+    snapshot = None
+    pending = {}
+    ready = deque()
+    reloaded = 0
+    # Image names by normalized path, names stay valid across undo
+    images = None
+    images_key = None
+
+    @classmethod
+    def start(cls, path):
+        cls.stop()
+
+        cls.path = path
+        cls.snapshot = None
+        cls.pending = {}
+        cls.ready = deque()
+        cls.reloaded = 0
+        cls.images = None
+        bpy.app.timers.register(live_sync_tick, first_interval=cls.busy_interval)
+
+    @classmethod
+    def stop(cls):
+        if bpy.app.timers.is_registered(live_sync_tick):
+            bpy.app.timers.unregister(live_sync_tick)
+
+        cls.close_scanner()
+        cls.path = None
+
+    @classmethod
+    def is_running(cls):
+        return bpy.app.timers.is_registered(live_sync_tick)
+
+    @classmethod
+    def close_scanner(cls):
+        if cls.scanner:
+            cls.scanner.close()
+            cls.scanner = None
+
+    @classmethod
+    def tick(cls):
+        if not cls.path or not os.path.isdir(cls.path):
+            cls.close_scanner()
+            return cls.interval
+
+        deadline = time.perf_counter() + cls.budget
+
+        # Pending reloads get the whole budget, a big folder scan would starve them
+        if not cls.ready:
+            scanned = cls.scan(deadline)
+            if scanned:
+                cls.settle()
+        cls.apply(deadline)
+
+        if cls.scanner or cls.ready:
+            return cls.busy_interval
+        return cls.interval
+
+    @classmethod
+    def scan(cls, deadline):
+        if not cls.scanner:
+            cls.scanner = os.scandir(cls.path)
+            cls.scanned = {}
+
+        for entry in cls.scanner:
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            cls.scanned[entry.path] = (stat.st_mtime_ns, stat.st_size)
+
+            if time.perf_counter() > deadline:
+                return False
+
+        cls.close_scanner()
+
+        # The first full scan is only the baseline
+        if cls.snapshot is not None:
+            now = time.monotonic()
+            for path, stamp in cls.scanned.items():
+                if not cls.snapshot.get(path) == stamp:
+                    cls.pending[path] = (stamp, now)
+
+        cls.snapshot = cls.scanned
+        return True
+
+    @classmethod
+    def settle(cls):
+        debounce = bpy.context.scene.taper_configs.live_sync_debounce
+        now = time.monotonic()
+
+        for path, (stamp, since) in list(cls.pending.items()):
+            current = cls.snapshot.get(path)
+            if current is None:
+                del cls.pending[path]
+            elif not current == stamp:
+                # Still being written, wait for it to settle again
+                cls.pending[path] = (current, now)
+            elif now - since >= debounce:
+                del cls.pending[path]
+                cls.ready.append(path)
+
+    @classmethod
+    def build_images(cls):
+        cache = ImageCache()
+        cache.build()
+
+        cls.images = {key: [image.name for image in images] for key, images in cache.images.items()}
+        # Packed images are rebuilt when a file in their source folder changes
+        for image in bpy.data.images:
+            entry = image.get(ChannelPacker.key)
+            if entry:
+                key = ImageCache.normalize_path(entry["path"])
+                cls.images.setdefault(key, []).append(image.name)
+        cls.images_key = (bpy.data.filepath, len(bpy.data.images))
+
+    @classmethod
+    def get_images(cls, path):
+        if cls.images is None or not cls.images_key == (bpy.data.filepath, len(bpy.data.images)):
+            cls.build_images()
+
+        names = cls.images.get(ImageCache.normalize_path(path))
+        if not names:
+            # A changed tile reloads the tiled image holding it
+            path = UDIMTiles.to_token(path)
+            names = cls.images.get(ImageCache.normalize_path(path))
+        if not names:
+            names = cls.images.get(ImageCache.normalize_path(os.path.dirname(path)), ())
+
+        images = [bpy.data.images.get(name) for name in names]
+        if not all(images):
+            # Renamed or removed since the last build
+            cls.images = None
+        return path, [image for image in images if image]
+
+    @classmethod
+    def apply(cls, deadline):
+        reloaded = 0
+
+        # At least one file per tick, however slow a single reload is
+        while cls.ready:
+            path, images = cls.get_images(cls.ready.popleft())
+
+            for image in images:
+                ChannelPacker.refresh(image)
+
+                # Only the stamp is compared here, hashing a large file would stall the UI
+                image_path = ImageManifest.get_image_path(image)
+                if ImageManifest.check(image, image_path) == 'CHANGED':
+                    ImageManifest.reload(image, image_path)
+                    reloaded += 1
+
+            if time.perf_counter() >= deadline:
+                break
+
+        if reloaded:
+            cls.reloaded += reloaded
+            for window in bpy.context.window_manager.windows:
+                for area in window.screen.areas:
+                    if area.type == 'VIEW_3D':
+                        area.tag_redraw()
+
+
+class BackgroundWorker(object):
+
+    result_prefix = "TAPER_RESULT:"
+    progress_prefix = "TAPER_PROGRESS:"
+
+    def __init__(self, job, payload, blend_path=None, name=None):
+        self.job = job
+        self.payload = payload
+        self.blend_path = blend_path
+        self.name = name or job
+
+        self.process = None
+        self.task_path = None
+        self.lines = queue.Queue()
+        self.output = []
+        self.progress = []
+        self.result = None
+        self.error = None
+        self.done = False
+        self.started = None
+        self.elapsed = None
+
+    def get_command(self):
+        addon_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        expr = (
+            "import sys, importlib; sys.path.insert(0, %r); "
+            "importlib.import_module(%r).BackgroundWorker.main()"
+        ) % (addon_dir, __name__)
+
+        command = [bpy.app.binary_path, "--background", "--factory-startup"]
+        if self.blend_path:
+            command.append(self.blend_path)
+        command += ["--python-expr", expr, "--", self.task_path]
+
+        return command
+
+    def start(self):
+        fd, self.task_path = tempfile.mkstemp(prefix="taper_", suffix=".json")
+        with os.fdopen(fd, 'w') as f:
+            json.dump({"job": self.job, "payload": self.payload}, f)
+
+        self.started = time.perf_counter()
+        self.process = subprocess.Popen(
+            self.get_command(),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            universal_newlines=True,
+            bufsize=1
+        )
+
+        # Read on a thread so polling never blocks on the pipe
+        threading.Thread(target=self.read_output, daemon=True).start()
+
+    def read_output(self):
+        for line in self.process.stdout:
+            self.lines.put(line)
+        self.lines.put(None)
+
+    def poll(self):
+        if self.done:
+            return True
+
+        while True:
+            try:
+                line = self.lines.get_nowait()
+            except queue.Empty:
+                return False
+
+            if line is None:
+                break
+
+            line = line.rstrip()
+            if line.startswith(self.result_prefix):
+                response = json.loads(line[len(self.result_prefix):])
+                self.result = response.get("result")
+                self.error = response.get("error")
+            elif line.startswith(self.progress_prefix):
+                self.progress.append(json.loads(line[len(self.progress_prefix):]))
+            else:
+                self.output.append(line)
+
+        self.process.wait()
+        self.finish()
+
+        if self.error is None and self.result is None:
+            self.error = "Worker exited with code %d" % self.process.returncode
+            print("\n".join(self.output[-20:]))
+
+        return True
+
+    def finish(self):
+        self.done = True
+        self.elapsed = time.perf_counter() - self.started
+        if self.task_path and os.path.exists(self.task_path):
+            os.remove(self.task_path)
+
+    def cancel(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+        if self.process and not self.done:
+            self.error = "Cancelled"
+            self.finish()
+
+    @classmethod
+    def emit(cls, prefix, data):
+        print(prefix + json.dumps(data))
+        sys.stdout.flush()
+
+    @classmethod
+    def main(cls):
+        # Entry point inside the background Blender process
+        task_path = sys.argv[sys.argv.index("--") + 1]
+        with open(task_path) as f:
+            task = json.load(f)
+
+        if not hasattr(bpy.types.Scene, "taper_configs"):
+            register()
+
+        try:
+            result = worker_jobs[task["job"]](task["payload"])
+            cls.emit(cls.result_prefix, {"result": result})
+        except Exception:
+            cls.emit(cls.result_prefix, {"error": traceback.format_exc()})
+
+
+class WorkerPool(object):
+
+    def __init__(self, workers, max_workers):
+        self.workers = list(workers)
+        self.waiting = deque(self.workers)
+        self.running = []
+        self.max_workers = max(1, max_workers)
+
+    def poll(self):
+        while self.waiting and len(self.running) < self.max_workers:
+            worker = self.waiting.popleft()
+            worker.start()
+            self.running.append(worker)
+
+        for worker in list(self.running):
+            if worker.poll():
+                self.running.remove(worker)
+
+        return not self.waiting and not self.running
+
+    def wait(self, interval=0.05):
+        while not self.poll():
+            time.sleep(interval)
+
+    def cancel(self):
+        self.waiting.clear()
+        for worker in self.running:
+            worker.cancel()
+        self.running = []
+
+    def get_errors(self):
+        return [(worker.name, worker.error) for worker in self.workers if worker.error]
+
+    @staticmethod
+    def get_error_summary(errors):
+        # One line per failed worker, the exception line closes a traceback
+        return "; ".join(
+            "%s: %s" % (name, next(
+                (line.strip() for line in reversed(error.splitlines()) if line.strip()), "Unknown error"))
+            for name, error in errors
+        )
+
+    @staticmethod
+    def split_shards(weighted, count):
+        # Heaviest first into the lightest shard keeps the workers balanced
+        shards = [[0, []] for i in range(max(1, min(count, len(weighted))))]
+
+        for weight, name in sorted(weighted, reverse=True):
+            shard = min(shards, key=lambda shard: shard[0])
+            shard[0] += weight
+            shard[1].append(name)
+
+        return [names for weight, names in shards if names]
+
+
+class CollectionExporter(object):
+
+    @staticmethod
+    def get_batch_collections():
+        # Same collections the FBX batch 'COLLECTION' mode writes
+        return [collection for collection in bpy.data.collections if collection.objects]
+
+    @staticmethod
+    def get_file_path(path, collection_name, extension=".fbx"):
+        return os.path.join(path, bpy.path.clean_name(collection_name) + extension)
+
+    @staticmethod
+    def get_fingerprints(collections, all_objects=False):
+        fingerprint = MeshFingerprint()
+        return {c.name: fingerprint.hash_collection(c, all_objects) for c in collections}
+
+    @staticmethod
+    def get_collection_weight(collection):
+        return sum(
+            len(obj.data.vertices) if obj.type == 'MESH' else 1
+            for obj in collection.objects
+        )
+
+    @classmethod
+    def split_shards(cls, collections, count):
+        return WorkerPool.split_shards(
+            [(cls.get_collection_weight(c), c.name) for c in collections], count)
+
+    @classmethod
+    def get_workers(cls, path, collections, max_workers, blend_path, lods=None):
+        return [
+            BackgroundWorker(
+                "export_fbx_collections",
+                {
+                    "path": path,
+                    "collections": shard,
+                    "settings": Utils.get_export_settings(bpy.context.scene.taper_configs),
+                    "lods": lods
+                },
+                blend_path,
+                name=", ".join(shard)
+            )
+            for shard in cls.split_shards(collections, max_workers)
+        ]
+
+    @classmethod
+    def get_active_worker(cls, context, path, blend_path, lods=None):
+        return BackgroundWorker(
+            "export_fbx_active",
+            {
+                "path": path,
+                "collection": context.view_layer.active_layer_collection.name,
+                "settings": Utils.get_export_settings(context.scene.taper_configs),
+                "lods": lods
+            },
+            blend_path,
+            name=context.view_layer.active_layer_collection.name
+        )
+
+    @classmethod
+    @Profiler.timed("fbx_export_workers")
+    def export_parallel(cls, path, collections, max_workers, lods=None):
+        blend_path, temp_dir = Utils.get_worker_blend_path()
+
+        workers = cls.get_workers(path, collections, max_workers, blend_path, lods)
+        pool = WorkerPool(workers, max_workers)
+        try:
+            pool.wait()
+        finally:
+            if temp_dir:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+
+        return pool
+
+    @staticmethod
+    def get_exported(pool):
+        return {
+            name: worker.elapsed
+            for worker in pool.workers if not worker.error
+            for name in worker.payload["collections"]
+        }
+
+    @classmethod
+    def record(cls, manifest, path, fingerprints, exported, extension=".fbx"):
+        for name, duration in exported.items():
+            file_path = cls.get_file_path(path, name, extension)
+            if os.path.exists(file_path):
+                manifest.record(file_path, fingerprints[name], duration)
+        manifest.save()
+
+    @staticmethod
+    def find_layer_collection(layer_collection, name):
+        if layer_collection.name == name:
+            return layer_collection
+        for child in layer_collection.children:
+            found = CollectionExporter.find_layer_collection(child, name)
+            if found:
+                return found
+        return None
+
+    @staticmethod
+    def include_layer_collections(layer_collection, targets, included=None):
+        # Excluded collections holding targets join the view layer for the export
+        if included is None:
+            included = []
+
+        if layer_collection.exclude and any(
+                obj in targets for obj in layer_collection.collection.all_objects):
+            layer_collection.exclude = False
+            included.append(layer_collection)
+
+        for child in layer_collection.children:
+            CollectionExporter.include_layer_collections(child, targets, included)
+        return included
+
+    @classmethod
+    def export_gltf(cls, path, objects, options):
+        # The glTF exporter has no batch mode, each file is written from a selection
+        view_layer = bpy.context.view_layer
+        selected = set(obj for obj in view_layer.objects if obj.select_get())
+        active = view_layer.objects.active
+
+        if bpy.app.background:
+            # Stands in for the line the FBX exporter prints, for the progress bar
+            BackgroundWorker.emit(BackgroundWorker.progress_prefix, {"file": path})
+
+        # Only objects in the view layer can be selected, FBX writes the others too
+        targets = set(objects)
+        included = cls.include_layer_collections(view_layer.layer_collection, targets)
+        missing = targets - set(view_layer.objects)
+        if missing:
+            print("Warning: %d objects are not in the view layer and are missing from %s: %s" % (
+                len(missing), path, ", ".join(sorted(obj.name for obj in missing))))
+
+        try:
+            for obj in view_layer.objects:
+                obj.select_set(obj in targets)
+            with TextureProxies.full_paths():
+                bpy.ops.export_scene.gltf(filepath=path, use_selection=True, **options)
+        finally:
+            for layer_collection in reversed(included):
+                layer_collection.exclude = True
+            for obj in view_layer.objects:
+                obj.select_set(obj in selected)
+            view_layer.objects.active = active
+
+    @classmethod
+    def export_batch(cls, path, collections, settings):
+        if settings["format"] == 'FBX':
+            bpy.ops.export_scene.fbx(
+                filepath=path,
+
+                # SCENE_COLLECTION
+                batch_mode='COLLECTION',
+                use_batch_own_dir=False,
+                **settings["options"]
+            )
+            return
+
+        for collection in collections:
+            cls.export_gltf(
+                cls.get_file_path(path, collection.name, settings["extension"]),
+                collection.objects,
+                settings["options"]
+            )
+
+    @classmethod
+    def export_active(cls, path, collection, settings):
+        if settings["format"] == 'FBX':
+            bpy.ops.export_scene.fbx(
+                filepath=path,
+
+                use_active_collection=True,
+                batch_mode='OFF',
+                use_batch_own_dir=False,
+                **settings["options"]
+            )
+            return
+
+        cls.export_gltf(path, collection.all_objects, settings["options"])
+
+    @staticmethod
+    def export_active_job(payload):
+        view_layer = bpy.context.view_layer
+        view_layer.active_layer_collection = CollectionExporter.find_layer_collection(
+            view_layer.layer_collection,
+            payload["collection"]
+        )
+
+        collection = view_layer.active_layer_collection.collection
+        settings = payload["settings"]
+
+        lods = None
+        if payload.get("lods"):
+            lods = LODBuilder.build(collection.all_objects, payload["lods"])
+
+        CollectionExporter.export_active(payload["path"], collection, settings)
+
+        comparison = None
+        if settings["compare"]:
+            comparison = ExportComparison.compare_active(payload["path"], collection, settings)
+
+        return {"files": [payload["path"]], "lods": lods, "comparison": comparison}
+
+    @staticmethod
+    def keep_shard(collections, names):
+        # The hierarchy stays linked to the scene, so nested shard collections keep
+        # their scene and view layer. Collections outside the shard only lose their
+        # own objects, which the batch export then skips as empty
+        for collection in collections:
+            if not collection.name in names:
+                for obj in list(collection.objects):
+                    collection.objects.unlink(obj)
+
+    @staticmethod
+    def export_collections_job(payload):
+        CollectionExporter.keep_shard(bpy.data.collections, set(payload["collections"]))
+
+        collections = CollectionExporter.get_batch_collections()
+        settings = payload["settings"]
+
+        lods = None
+        if payload.get("lods"):
+            lods = LODBuilder.build(
+                [obj for collection in collections for obj in collection.objects],
+                payload["lods"]
+            )
+
+        CollectionExporter.export_batch(payload["path"], collections, settings)
+
+        comparison = None
+        if settings["compare"]:
+            comparison = ExportComparison.compare_collections(payload["path"], collections, settings)
+
+        return {
+            "files": [
+                CollectionExporter.get_file_path(payload["path"], name, settings["extension"])
+                for name in payload["collections"]
+            ],
+            "lods": lods,
+            "comparison": comparison
+        }
+
+
+class ExportComparison(object):
+
+    importers = {
+        'FBX': lambda path: bpy.ops.import_scene.fbx(filepath=path),
+        'GLB': lambda path: bpy.ops.import_scene.gltf(filepath=path),
+        'GLTF': lambda path: bpy.ops.import_scene.gltf(filepath=path)
+    }
+    # Best of a few imports, the first one also pays for loading the importer
+    repeat = 2
+
+    @staticmethod
+    def get_size(path):
+        size = os.path.getsize(path)
+        if not path.endswith(".gltf"):
+            return size
+
+        # A separate glTF lists the buffers and images it wrote next to it
+        with open(path, encoding='utf-8') as f:
+            gltf = json.load(f)
+        folder = os.path.dirname(path)
+        uris = set(
+            urllib.request.url2pathname(item["uri"])
+            for item in gltf.get("buffers", []) + gltf.get("images", [])
+            if "uri" in item and not item["uri"].startswith("data:")
+        )
+        for uri in uris:
+            file_path = os.path.join(folder, uri)
+            if os.path.isfile(file_path):
+                size += os.path.getsize(file_path)
+        return size
+
+    @staticmethod
+    def clear_scene():
+        for data in [bpy.data.objects, bpy.data.meshes, bpy.data.materials, bpy.data.images]:
+            bpy.data.batch_remove(list(data))
+
+    @classmethod
+    def measure(cls, files):
+        # Runs last in a worker, importing replaces the scene that was exported
+        results = {}
+        for name, paths in files.items():
+            results[name] = {}
+            for export_format, path in paths.items():
+                times = []
+                for run in range(cls.repeat):
+                    cls.clear_scene()
+                    start = time.perf_counter()
+                    cls.importers[export_format](path)
+                    times.append(time.perf_counter() - start)
+                results[name][export_format] = [cls.get_size(path), min(times)]
+
+        return results
+
+    @classmethod
+    def compare_collections(cls, path, collections, settings):
+        temp_dir = tempfile.mkdtemp(prefix="taper_compare_")
+        try:
+            fbx = Utils.get_export_settings(None, 'FBX')
+            CollectionExporter.export_batch(temp_dir, collections, fbx)
+            return cls.measure({
+                c.name: {
+                    'FBX': CollectionExporter.get_file_path(temp_dir, c.name, fbx["extension"]),
+                    settings["format"]: CollectionExporter.get_file_path(path, c.name, settings["extension"])
+                }
+                for c in collections
+            })
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    @classmethod
+    def compare_active(cls, path, collection, settings):
+        temp_dir = tempfile.mkdtemp(prefix="taper_compare_")
+        try:
+            fbx = Utils.get_export_settings(None, 'FBX')
+            fbx_path = os.path.join(temp_dir, "compare" + fbx["extension"])
+            CollectionExporter.export_active(fbx_path, collection, fbx)
+            return cls.measure({collection.name: {'FBX': fbx_path, settings["format"]: path}})
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    @staticmethod
+    def get_report(pool):
+        totals = {}
+        for worker in pool.workers:
+            comparison = (worker.result or {}).get("comparison") or {}
+            for formats in comparison.values():
+                for export_format, (size, seconds) in formats.items():
+                    total = totals.setdefault(export_format, [0, 0.0])
+                    total[0] += size
+                    total[1] += seconds
+
+        if len(totals) < 2:
+            return None
+        return " | ".join(
+            "%s %s, loads in %.2fs" % (export_format, Utils.format_size(size), seconds)
+            for export_format, (size, seconds) in sorted(totals.items())
+        )
+
+
+class MeshFingerprint(object):
+
+    # Object types whose geometry only exists once evaluated
+    evaluated_types = {'CURVE', 'FONT', 'SURFACE', 'META'}
+
+    def __init__(self):
+        # Meshes shared by several objects are only hashed once
+        self.meshes = {}
+        self.evaluated = {}
+        self.depsgraph = None
+
+    @staticmethod
+    def hash_array(digest, collection, attribute, dtype, size=1):
+        data = np.empty(len(collection) * size, dtype=dtype)
+        collection.foreach_get(attribute, data)
+        digest.update(data.tobytes())
+
+    def hash_mesh(self, mesh):
+        if not mesh.name in self.meshes:
+            self.meshes[mesh.name] = self.hash_mesh_data(mesh)
+        return self.meshes[mesh.name]
+
+    def hash_evaluated(self, obj):
+        if obj.name in self.evaluated:
+            return self.evaluated[obj.name]
+
+        if self.depsgraph is None:
+            self.depsgraph = bpy.context.evaluated_depsgraph_get()
+
+        # Curves and text are exported as the mesh they evaluate to
+        evaluated = obj.evaluated_get(self.depsgraph)
+        mesh = evaluated.to_mesh()
+        try:
+            self.evaluated[obj.name] = self.hash_mesh_data(mesh) if mesh else ""
+        finally:
+            evaluated.to_mesh_clear()
+        return self.evaluated[obj.name]
+
+    def hash_data(self, obj):
+        if obj.type == 'MESH':
+            return self.hash_mesh(obj.data)
+        if obj.type in self.evaluated_types:
+            return self.hash_evaluated(obj)
+        return ""
+
+    def hash_mesh_data(self, mesh):
+        digest = hashlib.sha1()
+        self.hash_array(digest, mesh.vertices, "co", np.float32, 3)
+        self.hash_array(digest, mesh.loops, "vertex_index", np.int32)
+        self.hash_array(digest, mesh.polygons, "loop_total", np.int32)
+        self.hash_array(digest, mesh.polygons, "material_index", np.int32)
+        self.hash_array(digest, mesh.polygons, "use_smooth", np.bool_)
+
+        for uv_layer in mesh.uv_layers:
+            digest.update(uv_layer.name.encode())
+            self.hash_array(digest, uv_layer.data, "uv", np.float32, 2)
+        for color_layer in mesh.vertex_colors:
+            digest.update(color_layer.name.encode())
+            self.hash_array(digest, color_layer.data, "color", np.float32, 4)
+
+        return digest.hexdigest()
+
+    @staticmethod
+    def get_property_values(struct):
+        values = []
+        for prop in struct.bl_rna.properties:
+            if prop.identifier == "rna_type" or prop.is_readonly or prop.type == 'COLLECTION':
+                continue
+
+            value = getattr(struct, prop.identifier)
+            if prop.type == 'POINTER':
+                value = getattr(value, "name", None) if value else None
+            elif isinstance(value, set):
+                # Enum flags, keep the order stable between sessions
+                value = tuple(sorted(value))
+            elif getattr(prop, "is_array", False):
+                value = tuple(value)
+            values.append((prop.identifier, value))
+
+        return values
+
+    def hash_targets(self, struct, digest):
+        # Booleans, shrinkwraps and the like also change with the objects they point at
+        for prop in struct.bl_rna.properties:
+            if not prop.type == 'POINTER' or prop.is_readonly:
+                continue
+
+            target = getattr(struct, prop.identifier)
+            if isinstance(target, bpy.types.Collection):
+                targets = sorted(target.all_objects, key=lambda obj: obj.name)
+            elif isinstance(target, bpy.types.Object):
+                targets = [target]
+            else:
+                continue
+
+            for obj in targets:
+                digest.update(repr([tuple(row) for row in obj.matrix_world]).encode())
+                digest.update(self.hash_data(obj).encode())
+
+    def hash_object(self, obj, digest, include_transform=True):
+        digest.update(repr((obj.name, obj.type, obj.parent.name if obj.parent else None)).encode())
+
+        if include_transform:
+            digest.update(repr([tuple(row) for row in obj.matrix_world]).encode())
+
+        for modifier in obj.modifiers:
+            digest.update(repr(self.get_property_values(modifier)).encode())
+            self.hash_targets(modifier, digest)
+
+        digest.update(repr([
+            (slot.link, slot.material.name if slot.material else None)
+            for slot in obj.material_slots
+        ]).encode())
+
+        digest.update(self.hash_data(obj).encode())
+
+    @Profiler.timed("fingerprint")
+    def hash_collection(self, collection, all_objects=False):
+        digest = hashlib.sha1()
+        # The scope is part of the hash, batch exports only take direct objects
+        digest.update(b"all_objects" if all_objects else b"objects")
+
+        objects = collection.all_objects if all_objects else collection.objects
+        for obj in sorted(objects, key=lambda obj: obj.name):
+            self.hash_object(obj, digest)
+
+        return digest.hexdigest()
+
+
+class ExportManifest(object):
+
+    file_name = "taper_manifest.json"
+
+    def __init__(self, folder):
+        self.path = os.path.join(folder, self.file_name)
+        self.files = {}
+
+        if os.path.exists(self.path):
+            try:
+                with open(self.path) as f:
+                    self.files = json.load(f).get("files", {})
+            except (OSError, ValueError):
+                print("Ignoring unreadable manifest at : " + self.path)
+
+    def is_dirty(self, file_path, fingerprint):
+        entry = self.files.get(os.path.basename(file_path))
+        if not entry or not entry["fingerprint"] == fingerprint:
+            return True
+
+        # Rewritten or removed outside of Taper
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return True
+        return not (stat.st_size == entry["size"] and stat.st_mtime == entry["mtime"])
+
+    def record(self, file_path, fingerprint, duration=None):
+        stat = os.stat(file_path)
+        self.files[os.path.basename(file_path)] = {
+            "fingerprint": fingerprint,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "hash": Utils.get_file_hash(file_path),
+            "exported_at": time.time(),
+            "duration": duration
+        }
+
+    def save(self):
+        temp_path = self.path + ".tmp"
+        with open(temp_path, 'w') as f:
+            json.dump({"version": 1, "files": self.files}, f, indent=2, sort_keys=True)
+        os.replace(temp_path, self.path)
+
+
+class LODBuilder(object):
+
+    folder = ".taper_lods"
+    suffix = "_LOD%d"
+
+    @staticmethod
+    def get_ratios(configs: Configs):
+        try:
+            values = [float(value) for value in configs.lod_levels.replace(',', ' ').split()]
+        except ValueError:
+            return None, "LOD levels must be numbers"
+        if not values or not all(0.0 < value <= 1.0 for value in values):
+            return None, "LOD levels must be between 0 and 1"
+
+        # Face count follows the screen area, the square of the screen height share
+        if configs.lod_mode == 'SCREEN_SIZE':
+            values = [value * value for value in values]
+        return values, None
+
+    @classmethod
+    def get_payload(cls, configs: Configs, folder):
+        if not configs.export_lods:
+            return None, None
+
+        ratios, error = cls.get_ratios(configs)
+        if error:
+            return None, error
+        return {"ratios": ratios, "cache": os.path.join(folder, cls.folder)}, None
+
+    @staticmethod
+    def salt(fingerprints, lods):
+        # Changing the levels has to export again even if the meshes did not change
+        if not lods:
+            return fingerprints
+        return {
+            name: hashlib.sha1((fingerprint + repr(lods["ratios"])).encode()).hexdigest()
+            for name, fingerprint in fingerprints.items()
+        }
+
+    @staticmethod
+    def get_key(fingerprint, obj, ratios):
+        # Geometry only, instances and renamed or moved objects share their levels
+        digest = hashlib.sha1()
+        digest.update(fingerprint.hash_mesh(obj.data).encode())
+        for modifier in obj.modifiers:
+            digest.update(repr(fingerprint.get_property_values(modifier)).encode())
+        digest.update(repr(ratios).encode())
+        return digest.hexdigest()
+
+    @classmethod
+    def decimate(cls, obj, key, ratios):
+        meshes = []
+        for level, ratio in enumerate(ratios, 1):
+            # Every level decimates the full mesh, errors do not stack up
+            modifier = obj.modifiers.new("Taper LOD", 'DECIMATE')
+            modifier.ratio = ratio
+
+            evaluated = obj.evaluated_get(bpy.context.evaluated_depsgraph_get())
+            mesh = bpy.data.meshes.new_from_object(evaluated)
+            mesh.name = key[:16] + cls.suffix % level
+            meshes.append(mesh)
+
+            obj.modifiers.remove(modifier)
+
+        return meshes
+
+    @classmethod
+    def load_levels(cls, cache_path, obj):
+        materials = set(bpy.data.materials)
+        images = set(bpy.data.images)
+
+        # Level names sort by number, _LOD10 comes after _LOD2
+        with bpy.data.libraries.load(cache_path) as (data_from, data_to):
+            data_to.meshes = sorted(
+                data_from.meshes, key=lambda name: int(name.rsplit(cls.suffix[:-2], 1)[1]))
+
+        # Slots point back at the local materials, LOD0 and its levels share them
+        for mesh in data_to.meshes:
+            for slot, mat in enumerate(obj.data.materials[:len(mesh.materials)]):
+                mesh.materials[slot] = mat
+
+        # Caches written with their materials appended copies of them
+        for mat in set(bpy.data.materials) - materials:
+            if not mat.users:
+                bpy.data.materials.remove(mat)
+        for image in set(bpy.data.images) - images:
+            if not image.users:
+                bpy.data.images.remove(image)
+
+        return data_to.meshes
+
+    @classmethod
+    def save_levels(cls, cache_path, meshes):
+        Utils.ensure_path(os.path.dirname(cache_path))
+        temp_path = cache_path + ".tmp.blend"
+
+        # Only geometry is cached, emptied slots keep the face material indices
+        slots = {mesh: list(mesh.materials) for mesh in meshes}
+        for mesh in meshes:
+            for slot in range(len(mesh.materials)):
+                mesh.materials[slot] = None
+        try:
+            bpy.data.libraries.write(temp_path, set(meshes))
+        finally:
+            for mesh, materials in slots.items():
+                for slot, mat in enumerate(materials):
+                    mesh.materials[slot] = mat
+        os.replace(temp_path, cache_path)
+
+    @classmethod
+    def get_levels(cls, obj, lods, fingerprint, built):
+        # Level meshes and whether they had to be decimated in this run
+        key = cls.get_key(fingerprint, obj, lods["ratios"])
+        if key in built:
+            return built[key], False
+
+        cache_path = os.path.join(lods["cache"], key + ".blend")
+        decimated = not os.path.exists(cache_path)
+        if decimated:
+            meshes = cls.decimate(obj, key, lods["ratios"])
+            cls.save_levels(cache_path, meshes)
+        else:
+            meshes = cls.load_levels(cache_path, obj)
+
+        built[key] = meshes
+        return meshes, decimated
+
+    @classmethod
+    def add_levels(cls, obj, meshes):
+        # An empty takes the object's place and transform, LOD0 is the object itself
+        name = obj.name
+        empty = bpy.data.objects.new(name + "_LODGroup", None)
+        for collection in obj.users_collection:
+            collection.objects.link(empty)
+
+        empty.parent = obj.parent
+        empty.matrix_parent_inverse = obj.matrix_parent_inverse.copy()
+        empty.matrix_basis = obj.matrix_basis.copy()
+
+        obj.parent = empty
+        obj.matrix_parent_inverse = Matrix()
+        obj.matrix_basis = Matrix()
+        obj.name = name + cls.suffix % 0
+        empty.name = name
+
+        for level, mesh in enumerate(meshes, 1):
+            lod = bpy.data.objects.new(name + cls.suffix % level, mesh)
+            for collection in obj.users_collection:
+                collection.objects.link(lod)
+            lod.parent = empty
+
+    @classmethod
+    @Profiler.timed("lod_build")
+    def build(cls, objects, lods):
+        fingerprint = MeshFingerprint()
+        built = {}
+        meshes = {obj.name: obj for obj in objects if obj.type == 'MESH'}
+
+        decimated = 0
+        for name in sorted(meshes):
+            obj = meshes[name]
+            levels, is_new = cls.get_levels(obj, lods, fingerprint, built)
+            cls.add_levels(obj, levels)
+            decimated += is_new
+
+        return {"objects": len(meshes), "decimated": decimated}
+
+
+class ExportFBXCollectionsOperator(bpy.types.Operator):
+    bl_idname = bl_info["operator_id_prefix"] + ".export_fbx_collections"
+    bl_label = "Export FBX Collections"
+    button_label = "All"
+
+    @classmethod
+    def get_dirty_collections(self, configs, path, lods=None):
+        collections = CollectionExporter.get_batch_collections()
+        if not configs.incremental_export:
+            return collections, collections, None, None
+
+        manifest = ExportManifest(path)
+        fingerprints = LODBuilder.salt(CollectionExporter.get_fingerprints(collections), lods)
+        extension = Utils.export_extensions[configs.export_format]
+        dirty = [
+            c for c in collections
+            if manifest.is_dirty(CollectionExporter.get_file_path(path, c.name, extension), fingerprints[c.name])
+        ]
+
+        return collections, dirty, manifest, fingerprints
+
+    @Profiler.operator
+    def execute(self, context):
+        configs = context.scene.taper_configs
+        if configs.async_export:
+            return Utils.start_async_export(mode='ALL')
+
+        path, error = Utils.get_export_path(
+            configs=configs
+        )
+        if not path == None:
+            lods, error = LODBuilder.get_payload(configs, path)
+            if error:
+                self.report({'ERROR'}, error)
+                return {'CANCELLED'}
+
+            collections, dirty, manifest, fingerprints = self.get_dirty_collections(
+                configs, path, lods)
+
+            if not dirty:
+                self.report({'INFO'}, "All collections up to date")
+                return {'FINISHED'}
+
+            settings = Utils.get_export_settings(configs)
+            if (configs.parallel_export and len(dirty) > 1) or len(dirty) < len(collections) \
+                    or lods or settings["compare"]:
+                # Only a worker can batch export a subset of the collections, LODs
+                # are added to and comparisons import into a throwaway copy of the scene
+                workers = configs.export_workers if configs.parallel_export else 1
+                exported, failed = self.export_parallel(path, dirty, workers, lods)
+            else:
+                failed = 0
+                start = time.perf_counter()
+                with Profiler.span("fbx_export"):
+                    CollectionExporter.export_batch(path, dirty, settings)
+                exported = {c.name: time.perf_counter() - start for c in dirty}
+                self.report({'INFO'}, "%s Exported" % settings["format"])
+
+            if manifest:
+                CollectionExporter.record(
+                    manifest, path, fingerprints, exported, settings["extension"])
+            if failed:
+                return {'CANCELLED'}
+        else:
+            self.report({'ERROR'}, error)
+            print(error)
+            return {'CANCELLED'}
+
+        return {'FINISHED'}
+
+    def export_parallel(self, path, collections, max_workers, lods=None):
+        pool = CollectionExporter.export_parallel(path, collections, max_workers, lods)
+
+        errors = pool.get_errors()
+        for name, error in errors:
+            print("Failed to export " + name + "\n" + error)
+
+        if errors:
+            self.report({'ERROR'}, "%d of %d workers failed: %s" % (
+                len(errors), len(pool.workers), WorkerPool.get_error_summary(errors)))
+        else:
+            self.report({'INFO'}, "Exported %d collections with %d workers" % (
+                len(collections), len(pool.workers)))
+
+        comparison = ExportComparison.get_report(pool)
+        if comparison:
+            self.report({'INFO'}, comparison)
+
+        return CollectionExporter.get_exported(pool), len(errors)
+
+
+class ExportFBXActiveCollectionOperator(bpy.types.Operator):
+    bl_idname = bl_info["operator_id_prefix"] + ".export_fbx_active_collection"
+    bl_label = "Export Active FBX Collection"
+    button_label = "Active"
+
+    @classmethod
+    def check_dirty(self, context, path, lods=None):
+        if not context.scene.taper_configs.incremental_export:
+            return True, None, None
+
+        manifest = ExportManifest(os.path.dirname(path))
+        fingerprint = MeshFingerprint().hash_collection(
+            context.view_layer.active_layer_collection.collection,
+            all_objects=True
+        )
+        fingerprint = LODBuilder.salt({path: fingerprint}, lods)[path]
+        return manifest.is_dirty(path, fingerprint), manifest, fingerprint
+
+    @classmethod
+    def export(self, context, force=False):
+        configs = context.scene.taper_configs
+        path, error = Utils.get_export_path(
+            configs=configs,
+            filename=Utils.get_active_collection_name(context)
+        )
+        if path == None:
+            return 'ERROR', error
+
+        lods, error = LODBuilder.get_payload(configs, os.path.dirname(path))
+        if error:
+            return 'ERROR', error
+
+        dirty, manifest, fingerprint = self.check_dirty(context, path, lods)
+        if not force and not dirty:
+            return 'SKIPPED', "Export up to date"
+
+        settings = Utils.get_export_settings(configs)
+        message = "%s Exported" % settings["format"]
+
+        start = time.perf_counter()
+        if lods or settings["compare"]:
+            # LODs are added to and comparisons import into a throwaway copy of the scene
+            blend_path, temp_dir = Utils.get_worker_blend_path()
+            pool = WorkerPool([CollectionExporter.get_active_worker(
+                context, path, blend_path, lods)], 1)
+            try:
+                pool.wait()
+            finally:
+                if temp_dir:
+                    shutil.rmtree(temp_dir, ignore_errors=True)
+
+            errors = pool.get_errors()
+            for name, error in errors:
+                print("Failed to export " + name + "\n" + error)
+            if errors:
+                return 'ERROR', "Export failed: " + WorkerPool.get_error_summary(errors)
+
+            comparison = ExportComparison.get_report(pool)
+            if comparison:
+                message += ": " + comparison
+        else:
+            with Profiler.span("fbx_export"):
+                CollectionExporter.export_active(
+                    path, context.view_layer.active_layer_collection.collection, settings)
+
+        if manifest:
+            manifest.record(path, fingerprint, time.perf_counter() - start)
+            manifest.save()
+
+        return 'EXPORTED', message
+
+    @Profiler.operator
+    def execute(self, context):
+        if context.scene.taper_configs.async_export:
+            return Utils.start_async_export(mode='ACTIVE')
+
+        status, message = self.export(context)
+
+        if status == 'ERROR':
+            self.report({'ERROR'}, message)
+        else:
+            self.report({'INFO'}, message)
+        return {'FINISHED'}
+
+
+class ExportAsyncOperator(bpy.types.Operator):
+    bl_idname = bl_info["operator_id_prefix"] + ".export_async"
+    bl_label = "Export in Background"
+    bl_description = "Export in a background Blender process, press ESC to cancel"
+
+    mode: EnumProperty(
+        items=[
+            ('ALL', "All", "Export every collection"),
+            ('ACTIVE', "Active", "Export the active collection")
+        ],
+        default='ALL'
+    )
+
+    link: BoolProperty(
+        name="Send to Painter",
+        description="Open Substance Painter once the export finished.",
+        default=False
+    )
+
+    # The FBX exporter prints this line for every file it starts writing
+    progress_marker = "FBX export starting"
+
+    def invoke(self, context, event):
+        configs = context.scene.taper_configs
+        self.manifest = None
+        self.fingerprints = None
+
+        if self.mode == 'ALL':
+            path, error = Utils.get_export_path(configs=configs)
+            if path == None:
+                self.report({'ERROR'}, error)
+                return {'CANCELLED'}
+
+            lods, error = LODBuilder.get_payload(configs, path)
+            if error:
+                self.report({'ERROR'}, error)
+                return {'CANCELLED'}
+
+            collections, dirty, self.manifest, self.fingerprints = ExportFBXCollectionsOperator.get_dirty_collections(
+                configs, path, lods)
+            if not dirty:
+                self.report({'INFO'}, "All collections up to date")
+                return {'FINISHED'}
+
+            max_workers = configs.export_workers if configs.parallel_export else 1
+            self.blend_path, self.temp_dir = Utils.get_worker_blend_path()
+            workers = CollectionExporter.get_workers(
+                path, dirty, max_workers, self.blend_path, lods)
+            self.total = len(dirty)
+        else:
+            max_workers = 1
+            path, error = Utils.get_export_path(
+                configs=configs,
+                filename=Utils.get_active_collection_name(context)
+            )
+            if path == None:
+                self.report({'ERROR'}, error)
+                return {'CANCELLED'}
+
+            lods, error = LODBuilder.get_payload(configs, os.path.dirname(path))
+            if error:
+                self.report({'ERROR'}, error)
+                return {'CANCELLED'}
+
+            dirty, self.manifest, fingerprint = ExportFBXActiveCollectionOperator.check_dirty(
+                context, path, lods)
+            if not dirty:
+                self.report({'INFO'}, "Export up to date")
+                if self.link:
+                    level, message = SubstanceLinkOperator.launch(context, fingerprint)
+                    self.report({level}, message)
+                return {'FINISHED'}
+
+            self.fingerprints = {path: fingerprint}
+            self.blend_path, self.temp_dir = Utils.get_worker_blend_path()
+            workers = [CollectionExporter.get_active_worker(
+                context, path, self.blend_path, lods)]
+            self.total = 1
+
+        self.path = path
+        self.extension = Utils.export_extensions[configs.export_format]
+        self.pool = WorkerPool(workers, max_workers)
+        self.started = time.perf_counter()
+
+        wm = context.window_manager
+        wm.progress_begin(0, self.total)
+        self.timer = wm.event_timer_add(0.1, window=context.window)
+        wm.modal_handler_add(self)
+
+        return {'RUNNING_MODAL'}
+
+    def get_progress(self):
+        started = sum(
+            1 for worker in self.pool.workers
+            for line in worker.output if line.startswith(self.progress_marker)
+        ) + sum(len(worker.progress) for worker in self.pool.workers)
+        return min(started, self.total)
+
+    def finish(self, context):
+        wm = context.window_manager
+        wm.event_timer_remove(self.timer)
+        wm.progress_end()
+        context.workspace.status_text_set(None)
+
+        if self.temp_dir:
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            self.pool.cancel()
+            self.finish(context)
+            self.report({'WARNING'}, "Export cancelled")
+            return {'CANCELLED'}
+
+        if not event.type == 'TIMER':
+            return {'PASS_THROUGH'}
+
+        done = self.pool.poll()
+        progress = self.get_progress()
+
+        context.window_manager.progress_update(progress)
+        context.workspace.status_text_set(
+            "Taper: exporting %d/%d (ESC to cancel)" % (progress, self.total))
+
+        if not done:
+            return {'PASS_THROUGH'}
+
+        self.finish(context)
+        Profiler.record(
+            self.bl_label,
+            {worker.name: worker.elapsed for worker in self.pool.workers if worker.elapsed},
+            time.perf_counter() - self.started
+        )
+
+        errors = self.pool.get_errors()
+        for name, error in errors:
+            print("Failed to export " + name + "\n" + error)
+
+        # Files of the workers that succeeded are recorded even if others failed
+        if self.manifest and self.mode == 'ALL':
+            CollectionExporter.record(
+                self.manifest,
+                self.path,
+                self.fingerprints,
+                CollectionExporter.get_exported(self.pool),
+                self.extension
+            )
+
+        if errors:
+            self.report({'ERROR'}, "%d of %d workers failed: %s" % (
+                len(errors), len(self.pool.workers), WorkerPool.get_error_summary(errors)))
+            return {'FINISHED'}
+
+        if self.manifest and self.mode == 'ACTIVE':
+            self.manifest.record(
+                self.path, self.fingerprints[self.path], self.pool.workers[0].elapsed)
+            self.manifest.save()
+
+        self.report({'INFO'}, "%s Exported" % context.scene.taper_configs.export_format)
+        comparison = ExportComparison.get_report(self.pool)
+        if comparison:
+            self.report({'INFO'}, comparison)
+
+        if self.link:
+            fingerprint = self.fingerprints[self.path] if self.fingerprints else None
+            level, message = SubstanceLinkOperator.launch(context, fingerprint)
+            self.report({level}, message)
+
+        return {'FINISHED'}
+
+
+class MeshNormals(object):
+
+    @staticmethod
+    def process_mesh(mesh, mode):
+        # Newer Blender flips winding directly on the mesh data
+        if mode == 'FLIP' and not mesh.is_editmode and hasattr(mesh, "flip_normals"):
+            mesh.flip_normals()
+            return
+
+        if mesh.is_editmode:
+            bm = bmesh.from_edit_mesh(mesh)
+        else:
+            bm = bmesh.new()
+            bm.from_mesh(mesh)
+
+        if mode == 'FLIP':
+            bmesh.ops.reverse_faces(bm, faces=bm.faces, flip_multires=True)
+        else:
+            bmesh.ops.recalc_face_normals(bm, faces=bm.faces)
+
+        if mesh.is_editmode:
+            bmesh.update_edit_mesh(mesh)
+        else:
+            bm.to_mesh(mesh)
+            bm.free()
+            mesh.update()
+
+    @classmethod
+    @Profiler.timed("normals")
+    def process(cls, meshes, mode):
+        timings = []
+        for mesh in meshes:
+            start = time.perf_counter()
+            cls.process_mesh(mesh, mode)
+            timings.append((mesh.name, len(mesh.polygons), time.perf_counter() - start))
+
+        return timings
+
+    @staticmethod
+    def get_summary(timings):
+        faces = sum(timing[1] for timing in timings)
+        seconds = sum(timing[2] for timing in timings)
+        per_face = seconds * 1e9 / faces if faces else 0.0
+
+        return "%d faces in %.1f ms (%.0f ns/face)" % (faces, seconds * 1000, per_face)
+
+
+class MeshPrep(object):
+
+    @staticmethod
+    def get_unique_meshes(objects):
+        meshes = {}
+        for obj in objects:
+            meshes.setdefault(obj.data.name, obj.data)
+        return list(meshes.values())
+
+    @staticmethod
+    def ensure_materials(objects, name):
+        # Objects without any material share one new material
+        mat = None
+        for obj in objects:
+            if len(obj.data.materials) == 0:
+                if mat is None:
+                    mat = bpy.data.materials.new(name=name)
+                obj.data.materials.append(mat)
+
+    @staticmethod
+    def select_objects(context, objects):
+        for obj in context.view_layer.objects:
+            obj.select_set(obj in objects)
+        context.view_layer.objects.active = objects[0]
+
+    @classmethod
+    @Profiler.timed("unwrap")
+    def unwrap(cls, context, objects):
+        # Objects keep their material slots, group them by material instead
+        material_users = {}
+        for obj in objects:
+            for idx, slot in enumerate(obj.material_slots):
+                if slot.material:
+                    material_users.setdefault(slot.material.name, (obj, idx))
+
+        cls.select_objects(context, objects)
+        bpy.ops.object.mode_set(mode='EDIT')
+        bpy.ops.mesh.select_all(action='DESELECT')
+
+        # Slot select picks the faces of this material in every object in edit mode
+        for obj, idx in material_users.values():
+            context.view_layer.objects.active = obj
+            obj.active_material_index = idx
+            bpy.ops.object.material_slot_select()
+            # Smart UV project
+            bpy.ops.uv.smart_project()
+            bpy.ops.mesh.select_all(action='DESELECT')
+
+        bpy.ops.object.mode_set(mode='OBJECT')
+
+    @classmethod
+    @Profiler.timed("unwrap_workers")
+    def unwrap_parallel(cls, objects, max_workers):
+        blend_path, temp_dir = Utils.get_worker_blend_path()
+        output_dir = tempfile.mkdtemp(prefix="taper_uv_")
+
+        shards = WorkerPool.split_shards(
+            [(len(obj.data.polygons), obj.name) for obj in objects], max_workers)
+        workers = [
+            BackgroundWorker(
+                "smart_project",
+                {"objects": shard, "output": output_dir},
+                blend_path,
+                name=", ".join(shard)
+            )
+            for shard in shards
+        ]
+
+        pool = WorkerPool(workers, max_workers)
+        try:
+            pool.wait()
+
+            for worker in pool.workers:
+                if worker.result:
+                    cls.apply_uvs(worker.result["meshes"])
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+            if temp_dir:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+
+        return pool
+
+    @staticmethod
+    def apply_uvs(results):
+        for mesh_name, result in results.items():
+            mesh = bpy.data.meshes.get(mesh_name)
+            uvs = np.load(result["file"])
+            if mesh is None or not len(uvs) == len(mesh.loops) * 2:
+                print("Skipping unwrap result of " + mesh_name)
+                continue
+
+            uv_layer = mesh.uv_layers.get(result["layer"]) or mesh.uv_layers.new(name=result["layer"])
+            uv_layer.data.foreach_set("uv", uvs)
+            mesh.uv_layers.active = uv_layer
+            mesh.update()
+
+    @staticmethod
+    def smart_project_job(payload):
+        objects = [bpy.data.objects[name] for name in payload["objects"]]
+        MeshPrep.unwrap(bpy.context, objects)
+
+        results = {}
+        for idx, mesh in enumerate(MeshPrep.get_unique_meshes(objects)):
+            uv_layer = mesh.uv_layers.active
+            uvs = np.empty(len(mesh.loops) * 2, dtype=np.float32)
+            uv_layer.data.foreach_get("uv", uvs)
+
+            file_path = os.path.join(payload["output"], "%s_%d.npy" % (os.getpid(), idx))
+            np.save(file_path, uvs)
+            results[mesh.name] = {"file": file_path, "layer": uv_layer.name}
+
+        return {"meshes": results}
+
+
+class AutoNameUnwrapMaterialOperator(bpy.types.Operator):
+    bl_idname = bl_info["operator_id_prefix"] + ".name_unwrap_auto"
+    bl_label = "Auto Name Unwrap Material"
+    bl_options = {"REGISTER", "UNDO"}
+    button_label = "Auto UV, Mat, Normal"
+
+    @Profiler.operator
+    def execute(self, context):
+        configs = context.scene.taper_configs
+
+        active_obj = context.view_layer.objects.active
+        objects = [
+            obj for obj in context.selected_objects
+            if obj.type == 'MESH' and obj.visible_get() and not obj.data.library
+        ]
+        if not objects and active_obj and active_obj.type == 'MESH':
+            objects = [active_obj]
+        if not objects:
+            self.report({'ERROR'}, "No mesh selected")
+            return {'CANCELLED'}
+
+        if not context.mode == 'OBJECT':
+            bpy.ops.object.mode_set(mode='OBJECT')
+        selected = list(context.selected_objects)
+
+        # add a material if there isnt any
+        MeshPrep.ensure_materials(objects, Utils.get_active_collection_name(context))
+
+        # Recalculate normal
+        MeshNormals.process(MeshPrep.get_unique_meshes(objects), 'RECALC')
+
+        if configs.parallel_prep and len(objects) > 1 and bpy.data.is_saved:
+            pool = MeshPrep.unwrap_parallel(objects, configs.export_workers)
+            errors = pool.get_errors()
+            for name, error in errors:
+                print("Failed to unwrap " + name + "\n" + error)
+            if errors:
+                self.report({'ERROR'}, "%d of %d workers failed: %s" % (
+                    len(errors), len(pool.workers), WorkerPool.get_error_summary(errors)))
+        else:
+            MeshPrep.unwrap(context, objects)
+
+            # Restore the selection the unwrap replaced
+            MeshPrep.select_objects(context, selected or objects)
+            if active_obj:
+                context.view_layer.objects.active = active_obj
+
+        self.report({'INFO'}, "Prepared %d objects" % len(objects))
+
+        return {'FINISHED'}
+
+
+class FlipNormalOperator(bpy.types.Operator):
+    bl_idname = bl_info["operator_id_prefix"] + ".flip_normal"
+    bl_label = "Flip Normal"
+    bl_options = {"REGISTER", "UNDO"}
+    button_label = "Flip Normal"
+
+    mode: EnumProperty(
+        name="Mode",
+        items=[
+            ('FLIP', "Flip", "Reverse the winding of every face"),
+            ('RECALC', "Recalculate", "Make normals consistent and point outside")
+        ],
+        default='FLIP'
+    )
+
+    @Profiler.operator
+    def execute(self, context):
+        objects = [obj for obj in context.selected_objects if obj.type == 'MESH']
+        active_obj = context.view_layer.objects.active
+        if not objects and active_obj and active_obj.type == 'MESH':
+            objects = [active_obj]
+
+        meshes = MeshPrep.get_unique_meshes(
+            [obj for obj in objects if not obj.data.library])
+        if not meshes:
+            self.report({'ERROR'}, "No mesh selected")
+            return {'CANCELLED'}
+
+        timings = MeshNormals.process(meshes, self.mode)
+        for name, faces, seconds in timings:
+            print("%s: %d faces in %.2f ms" % (name, faces, seconds * 1000))
+
+        verb = "Flipped " if self.mode == 'FLIP' else "Recalculated "
+        self.report({'INFO'}, verb + MeshNormals.get_summary(timings))
+
+        return {'FINISHED'}
+
+
+class AutoCenterOperator(bpy.types.Operator):
+    bl_idname = bl_info["operator_id_prefix"] + ".center_auto"
+    bl_label = "Auto Center"
+    bl_options = {"REGISTER", "UNDO"}
+    button_label = "Auto Center"
+
+    center: EnumProperty(
+        name="Center",
+        items=[
+            ('MEDIAN', "Median Center", "Average of the vertices"),
+            ('BOUNDS', "Bounds Center", "Center of the bounding box")
+        ],
+        default='MEDIAN'
+    )
+
+    move_to_origin: BoolProperty(
+        name="Move to World Origin",
+        default=True
+    )
+
+    @classmethod
+    def poll(cls, context):
+        return context.mode == 'OBJECT'
+
+    @staticmethod
+    def get_coordinates(vertices):
+        co = np.empty(len(vertices) * 3, dtype=np.float32)
+        vertices.foreach_get("co", co)
+        return co.reshape(-1, 3)
+
+    @staticmethod
+    def set_coordinates(vertices, co):
+        vertices.foreach_set("co", co.ravel())
+
+    @classmethod
+    def get_center(self, co, center='MEDIAN'):
+        if center == 'BOUNDS':
+            return (co.min(axis=0) + co.max(axis=0)) / 2.0
+        return co.mean(axis=0, dtype=np.float64)
+
+    @classmethod
+    def center_mesh(self, mesh, center='MEDIAN'):
+        if len(mesh.vertices) == 0:
+            return None
+
+        co = self.get_coordinates(mesh.vertices)
+        offset = self.get_center(co, center).astype(np.float32)
+        if not offset.any():
+            return None
+
+        self.set_coordinates(mesh.vertices, co - offset)
+
+        # Shape keys hold their own copy of the coordinates
+        if mesh.shape_keys:
+            for key_block in mesh.shape_keys.key_blocks:
+                self.set_coordinates(
+                    key_block.data, self.get_coordinates(key_block.data) - offset)
+
+        mesh.update()
+        return offset
+
+    @classmethod
+    @Profiler.timed("center")
+    def center_objects(self, objects, center='MEDIAN', move_to_origin=True):
+        meshes = {}
+        for obj in objects:
+            if obj.type == 'MESH' and not obj.data.library:
+                meshes[obj.data.name] = obj.data
+
+        # Every user of a shifted mesh needs the inverse offset, selected or not
+        users = {}
+        for obj in bpy.data.objects:
+            if obj.type == 'MESH' and obj.data.name in meshes:
+                users.setdefault(obj.data.name, []).append(obj)
+
+        for name, mesh in meshes.items():
+            offset = self.center_mesh(mesh, center)
+            if offset is None:
+                continue
+
+            translation = Matrix.Translation(offset.tolist())
+            for obj in users[name]:
+                obj.matrix_basis = obj.matrix_basis @ translation
+
+                # Keep children where they are
+                for child in obj.children:
+                    child.matrix_parent_inverse = translation.inverted() @ child.matrix_parent_inverse
+
+        if move_to_origin:
+            for obj in objects:
+                obj.location = (0, 0, 0)
+
+        return len(meshes)
+
+    @Profiler.operator
+    def execute(self, context):
+        objects = [obj for obj in context.selected_objects if obj.type == 'MESH']
+        active_obj = context.view_layer.objects.active
+        if not objects and active_obj and active_obj.type == 'MESH':
+            objects = [active_obj]
+
+        if not objects:
+            self.report({'ERROR'}, "No mesh selected")
+            return {'CANCELLED'}
+
+        self.center_objects(objects, self.center, self.move_to_origin)
+        self.report({'INFO'}, "Centered %d objects" % len(objects))
+
+        return {'FINISHED'}
+
+
+class TaperExportPanel(bpy.types.Panel):
+    bl_idname = bl_info["panel_id_name_export"]
+    bl_label = bl_info["panel_label_export"]
+    bl_category = bl_info["name"]
+    bl_space_type = "VIEW_3D"
+    bl_region_type = "UI"
+
+    def draw(self, context):
+        layout = self.layout
+        scene = context.scene
+        configs = scene.taper_configs
+
+        if not bpy.data.is_saved:
+            layout.label(text="File not saved")
+
+        layout.label(text="Export Collections")
+        col = layout.column(align=True)
+        col.operator(
+            ExportFBXCollectionsOperator.bl_idname,
+            text=ExportFBXCollectionsOperator.button_label
+        )
+        col.operator(
+            ExportFBXActiveCollectionOperator.bl_idname,
+            text=ExportFBXActiveCollectionOperator.button_label
+        )
+
+        layout.prop(configs, "export_format")
+        if not configs.export_format == 'FBX':
+            row = layout.row(align=True)
+            row.prop(configs, "gltf_draco")
+            if configs.gltf_draco:
+                row.prop(configs, "gltf_draco_level")
+            layout.prop(configs, "gltf_image_format")
+            layout.prop(configs, "compare_formats")
+
+        layout.prop(configs, "export_to_folder")
+        if (configs.export_to_folder):
+            layout.prop(configs, "folder_export_path", text="")
+
+        layout.prop(configs, "incremental_export")
+        layout.prop(configs, "async_export")
+
+        layout.prop(configs, "export_lods")
+        if configs.export_lods:
+            row = layout.row(align=True)
+            row.prop(configs, "lod_mode", text="")
+            row.prop(configs, "lod_levels", text="")
+
+        row = layout.row(align=True)
+        row.prop(configs, "parallel_export")
+        if configs.parallel_export or configs.parallel_prep:
+            row.prop(configs, "export_workers")
+
+        layout.label(text="Utils")
+        col = layout.column(align=True)
+        col.operator(
+            FlipNormalOperator.bl_idname,
+            text=FlipNormalOperator.button_label
+        ).mode = 'FLIP'
+        col.operator(
+            FlipNormalOperator.bl_idname,
+            text="Recalculate Normal"
+        ).mode = 'RECALC'
+        col.operator(
+            AutoNameUnwrapMaterialOperator.bl_idname,
+            text=AutoNameUnwrapMaterialOperator.button_label
+        )
+        col.operator(
+            AutoCenterOperator.bl_idname,
+            text=AutoCenterOperator.button_label
+        )
+        layout.prop(configs, "parallel_prep")
+
+
+class TaperDiagnosticsPanel(bpy.types.Panel):
+    bl_idname = bl_info["panel_id_name_diagnostics"]
+    bl_label = bl_info["panel_label_diagnostics"]
+    bl_category = bl_info["name"]
+    bl_space_type = "VIEW_3D"
+    bl_region_type = "UI"
+    bl_parent_id = bl_info["panel_id_name_export"]
+    bl_options = {'DEFAULT_CLOSED'}
+
+    def draw(self, context):
+        layout = self.layout
+
+        if not Profiler.runs:
+            layout.label(text="No run recorded yet")
+            return
+
+        run = Profiler.runs[-1]
+        layout.label(text="%s: %.1f ms" % (run["name"], run["total"] * 1000))
+
+        col = layout.column(align=True)
+        spans = sorted(run["spans"].items(), key=lambda item: -item[1]["time"])
+        for name, span in spans:
+            row = col.row()
+            row.label(text=name if span["count"] == 1 else "%s (x%d)" % (name, span["count"]))
+            row.label(text="%.1f ms" % (span["time"] * 1000))
+
+        other = run["total"] - sum(span["time"] for name, span in spans)
+        if other > 0.0005:
+            row = col.row()
+            row.label(text="other")
+            row.label(text="%.1f ms" % (other * 1000))
+
+        layout.label(text="%d runs kept" % len(Profiler.runs))
+
+
+class PainterRemote(object):
+
+    def __init__(self, host="localhost", port=60041, timeout=2.0):
+        self.url = "http://%s:%d/run.json" % (host, port)
+        self.timeout = timeout
+
+    def execute(self, script, language="js"):
+        # Painter expects the script base64 encoded under its language key
+        command = json.dumps({
+            language: base64.b64encode(script.encode('utf-8')).decode('ascii')
+        }).encode('utf-8')
+
+        request = urllib.request.Request(
+            self.url,
+            data=command,
+            headers={"Content-Type": "application/json"}
+        )
+
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                body = response.read().decode('utf-8')
+        except OSError as e:
+            return None, "Substance Painter not reachable: " + str(e)
+
+        if not body:
+            return None, None
+
+        try:
+            result = json.loads(body)
+        except ValueError:
+            return None, "Invalid response from Substance Painter"
+
+        if isinstance(result, dict) and "error" in result:
+            return None, result["error"]
+
+        return result, None
+
+    def is_project_open(self, project_path, mesh_path):
+        result, error = self.execute(
+            "(function() {"
+            " if (!alg.project.isOpen()) return false;"
+            " var mesh = alg.project.lastImportedMeshPath();"
+            " return alg.project.url() == alg.fileIO.localFileToUrl(%s)"
+            " || mesh == %s || mesh == alg.fileIO.localFileToUrl(%s);"
+            " })()" % (json.dumps(project_path), json.dumps(mesh_path), json.dumps(mesh_path))
+        )
+        return bool(result) and error is None
+
+    def reload_mesh(self, mesh_path):
+        return self.execute(
+            "alg.project.reload(alg.fileIO.localFileToUrl(%s))" % json.dumps(mesh_path)
+        )
+
+
+class PainterSession(object):
+
+    # Painter processes launched by Taper keyed by normalized .spp path
+    sessions = {}
+
+    @staticmethod
+    def get_key(project_path):
+        return os.path.normcase(os.path.abspath(project_path))
+
+    @staticmethod
+    def get_remote(context):
+        return PainterRemote(port=Utils.get_preferences(context).painter_remote_port)
+
+    @classmethod
+    def get(cls, context, project_path, mesh_path):
+        if not Utils.get_preferences(context).reuse_painter_session:
+            return None
+
+        key = cls.get_key(project_path)
+
+        session = cls.sessions.get(key)
+        if session and session["process"] and session["process"].poll() is None:
+            return session
+        cls.sessions.pop(key, None)
+
+        # Painter may still be open from an earlier Blender session
+        if cls.get_remote(context).is_project_open(project_path, mesh_path):
+            session = cls.sessions[key] = {"process": None, "fingerprint": None}
+            return session
+
+        return None
+
+    @classmethod
+    def track(cls, project_path, process, fingerprint):
+        cls.sessions[cls.get_key(project_path)] = {
+            "process": process,
+            "fingerprint": fingerprint
+        }
+
+    @classmethod
+    @Profiler.timed("painter_update")
+    def update_mesh(cls, context, session, project_path, mesh_path, fingerprint):
+        remote = cls.get_remote(context)
+        if not remote.is_project_open(project_path, mesh_path):
+            return None, "Painter has another project open, reload the mesh manually"
+
+        result, error = remote.reload_mesh(mesh_path)
+        if error is None:
+            session["fingerprint"] = fingerprint
+        return result, error
 
 
 class SubstanceLinkOperator(bpy.types.Operator):
@@ -330,9 +3772,8 @@ class SubstanceLinkOperator(bpy.types.Operator):
 
     # update_mesh: BoolProperty(default=False)
 
-    def execute(self, context):
-        bpy.ops.taper.export_fbx_active_collection()
-
+    @classmethod
+    def launch(self, context, fingerprint=None):
         painter_path = Utils.get_substance_painter_path(
             context
         )
@@ -352,21 +3793,72 @@ class SubstanceLinkOperator(bpy.types.Operator):
 
         Utils.ensure_material_folder(context, context.scene.taper_configs)
 
-        subprocess.Popen(
-            [
-                painter_path,
-                "--disable-version-checking",
-                '--mesh',
-                mesh_path,
-                "--export-path",
-                texture_export_path,
-                sp_project_path
-            ]
-        )
+        session = PainterSession.get(context, sp_project_path, mesh_path)
+        if session:
+            if fingerprint and session["fingerprint"] == fingerprint:
+                return 'INFO', "Substance Painter already up to date"
+
+            result, error = PainterSession.update_mesh(
+                context, session, sp_project_path, mesh_path, fingerprint)
+            if error:
+                return 'WARNING', error
+            return 'INFO', "Mesh updated in Substance Painter"
+
+        command = [
+            painter_path,
+            "--disable-version-checking",
+            '--mesh',
+            mesh_path,
+            "--export-path",
+            texture_export_path,
+            sp_project_path
+        ]
+        if Utils.get_preferences(context).reuse_painter_session:
+            command.insert(1, "--enable-remote-scripting")
+
+        with Profiler.span("painter_launch"):
+            process = subprocess.Popen(command)
+        PainterSession.track(sp_project_path, process, fingerprint)
 
         print(sp_project_path)
 
-        self.report({'INFO'}, "Opening Substance Painter")
+        return 'INFO', "Opening Substance Painter"
+
+    @Profiler.operator
+    def execute(self, context):
+        if context.scene.taper_configs.async_export:
+            # Painter is opened by the export once it finished
+            return Utils.start_async_export(mode='ACTIVE', link=True)
+
+        configs = context.scene.taper_configs
+        name = Utils.get_active_collection_name(context)
+        mesh_path, error = Utils.get_export_path(configs, filename=name)
+        if mesh_path == None:
+            self.report({'ERROR'}, error)
+            return {'FINISHED'}
+
+        fingerprint = MeshFingerprint().hash_collection(
+            context.view_layer.active_layer_collection.collection,
+            all_objects=True
+        )
+
+        # An open Painter with an unchanged mesh needs neither export nor launch
+        session = PainterSession.get(
+            context,
+            Utils.get_sp_project_path(context, configs, name + ".spp"),
+            mesh_path
+        )
+        if session and session["fingerprint"] == fingerprint and os.path.exists(mesh_path):
+            self.report({'INFO'}, "Substance Painter already up to date")
+            return {'FINISHED'}
+
+        status, message = ExportFBXActiveCollectionOperator.export(context)
+        if status == 'ERROR':
+            self.report({'ERROR'}, message)
+            return {'FINISHED'}
+
+        level, message = self.launch(context, fingerprint)
+        self.report({level}, message)
 
         return {'FINISHED'}
 
@@ -377,43 +3869,194 @@ class SubstanceCleanNodeOperator(bpy.types.Operator):
     bl_description = "Remove all the node except output and Principled BSDF node"
     bl_options = {"REGISTER", "UNDO"}
 
+    keep_nodes = ['ShaderNodeBsdfPrincipled', 'ShaderNodeOutputMaterial']
+
     @classmethod
     def match_material_slot_with_textures(self, context, texture_export_path, material_name: str):
-        # We get all the node tree for current material
-        mat = bpy.data.materials[material_name]
-        node_tree = mat.node_tree
-        nodes = node_tree.nodes
+        return self.clean([bpy.data.materials[material_name]])
 
-        # If we want to clean up the texture node
-        for n in nodes:
-            if not (n.bl_idname == 'ShaderNodeBsdfPrincipled' or n.bl_idname == 'ShaderNodeOutputMaterial'):
+    @classmethod
+    @Profiler.timed("node_cleanup")
+    def clean(self, materials):
+        # Collect first, removing while iterating the nodes skips entries
+        doomed = [
+            (mat.node_tree.nodes, [n for n in mat.node_tree.nodes if not n.bl_idname in self.keep_nodes])
+            for mat in materials if mat.node_tree
+        ]
+
+        # Node removal only tags the trees, the shaders are rebuilt once
+        # with the depsgraph update after the whole batch
+        removed = 0
+        for nodes, targets in doomed:
+            for n in targets:
                 nodes.remove(n)
+            removed += len(targets)
 
-        previous = mat.use_nodes
-        mat.use_nodes = False
-        mat.use_nodes = previous
+        return removed
 
+    @Profiler.operator
     def execute(self, context):
-        texture_export_path = Utils.get_textures_export_path(
-            context,
-            context.scene.taper_configs
-        )
-
-        active_obj = bpy.context.view_layer.objects.active
-        if len(active_obj.data.materials) == 0:
-            self.report({'ERROR'}, "No material found in this selected object")
+        materials = Utils.get_target_materials(context, context.scene.taper_configs)
+        if len(materials) == 0:
+            self.report({'ERROR'}, "No material found in the selection")
         else:
-            for slot in active_obj.material_slots:
-                self.match_material_slot_with_textures(
-                    context,
-                    texture_export_path,
-                    slot.material.name
-                )
+            removed = self.clean(materials)
 
-        bpy.context.space_data.shading.type = 'RENDERED'
+            self.report({'INFO'}, "Removed %d nodes from %d materials" % (removed, len(materials)))
+
+        Utils.show_rendered(context, context.scene.taper_configs)
         return {'FINISHED'}
 
 
+class NodeTemplates(object):
+
+    # Layout a shared group was built for, stored on the group
+    key = "taper_layout"
+    color_sockets = ['Base Color', 'Subsurface Color']
+    vector_sockets = ['Normal', 'Displacement']
+
+    @staticmethod
+    def get_layout(wires, packed_channels):
+        # Which sockets are wired, their gloss/bump variant and packed channel
+        return json.dumps([
+            [socket_name, extra or "", packed_channels.get(socket_name, -1)]
+            for socket_name, img, extra in wires
+        ])
+
+    @staticmethod
+    def new_socket(group, in_out, socket_type, name):
+        # Blender 4.0 moved group sockets to the interface API
+        if hasattr(group, "interface"):
+            return group.interface.new_socket(name, in_out=in_out, socket_type=socket_type)
+        sockets = group.inputs if in_out == 'INPUT' else group.outputs
+        return sockets.new(socket_type, name)
+
+    @classmethod
+    def get_output_type(cls, socket_name):
+        if socket_name in cls.color_sockets:
+            return 'NodeSocketColor'
+        if socket_name in cls.vector_sockets:
+            return 'NodeSocketVector'
+        return 'NodeSocketFloat'
+
+    @classmethod
+    def get_group(cls, wires, packed_channels):
+        layout = cls.get_layout(wires, packed_channels)
+        group = next((g for g in bpy.data.node_groups if g.get(cls.key) == layout), None)
+        if group:
+            return group
+
+        group = bpy.data.node_groups.new(
+            "Taper Setup " + hashlib.sha1(layout.encode()).hexdigest()[:8], 'ShaderNodeTree')
+        group[cls.key] = layout
+
+        nodes = group.nodes
+        links = group.links
+        group_input = nodes.new('NodeGroupInput')
+        group_input.location = (-600, 0)
+        group_output = nodes.new('NodeGroupOutput')
+        group_output.location = (400, 0)
+
+        for socket_name, img, extra in wires:
+            if socket_name in packed_channels:
+                continue
+            cls.new_socket(group, 'INPUT', 'NodeSocketColor', socket_name)
+        if packed_channels:
+            cls.new_socket(group, 'INPUT', 'NodeSocketColor', "Packed")
+            cls.new_socket(group, 'INPUT', 'NodeSocketFloat', "Packed Alpha")
+        for socket_name, img, extra in wires:
+            cls.new_socket(group, 'OUTPUT', cls.get_output_type(socket_name), socket_name)
+
+        packed_outputs = None
+        if packed_channels:
+            separate = nodes.new(
+                'ShaderNodeSeparateColor' if hasattr(bpy.types, 'ShaderNodeSeparateColor')
+                else 'ShaderNodeSeparateRGB')
+            separate.location = (-400, 200)
+            links.new(separate.inputs[0], group_input.outputs["Packed"])
+            packed_outputs = [separate.outputs[i] for i in range(3)] + \
+                [group_input.outputs["Packed Alpha"]]
+
+        for node_index, (socket_name, img, extra) in enumerate(wires):
+            if socket_name in packed_channels:
+                output = packed_outputs[packed_channels[socket_name]]
+            else:
+                output = group_input.outputs[socket_name]
+            location = (0, -200 * node_index)
+
+            if socket_name == 'Displacement':
+                converter = nodes.new('ShaderNodeDisplacement')
+                links.new(converter.inputs[0], output)
+            elif socket_name == 'Normal' and extra == 'IS_BUMP':
+                converter = nodes.new('ShaderNodeBump')
+                links.new(converter.inputs[2], output)
+            elif socket_name == 'Normal':
+                converter = nodes.new('ShaderNodeNormalMap')
+                links.new(converter.inputs[1], output)
+            elif socket_name == 'Roughness' and extra == 'IS_GLOSS':
+                converter = nodes.new('ShaderNodeInvert')
+                links.new(converter.inputs[1], output)
+            else:
+                converter = None
+
+            if converter:
+                converter.location = location
+                output = converter.outputs[0]
+            links.new(group_output.inputs[socket_name], output)
+
+        return group
+
+    @classmethod
+    def build(cls, node_tree, target_shader_node, output_node, wires, packed_channels):
+        # Only the images and their mapping live in the material, the
+        # converters sit in a group shared by every material with this layout
+        nodes = node_tree.nodes
+        links = node_tree.links
+        x, y = target_shader_node.location
+
+        group_node = nodes.new('ShaderNodeGroup')
+        group_node.node_tree = cls.get_group(wires, packed_channels)
+        group_node.location = (x - 300, y)
+
+        mapping = nodes.new(type='ShaderNodeMapping')
+        mapping.location = (x - 1050, 0)
+        texture_input = nodes.new(type='ShaderNodeTexCoord')
+        texture_input.location = (x - 1250, 0)
+        links.new(mapping.inputs[0], texture_input.outputs[2])
+
+        node_index = 0
+        packed_node = None
+        for socket_name, img, extra in wires:
+            if socket_name in packed_channels and packed_node:
+                continue
+
+            node = nodes.new(type='ShaderNodeTexImage')
+            node.location = (x - 700, y - 300 * node_index)
+            node.image = img
+            links.new(node.inputs[0], mapping.outputs[0])
+            node_index += 1
+
+            if socket_name in packed_channels:
+                packed_node = node
+                node.label = "Packed"
+                links.new(group_node.inputs["Packed"], node.outputs[0])
+                links.new(group_node.inputs["Packed Alpha"], node.outputs[1])
+            else:
+                node.label = socket_name
+                links.new(group_node.inputs[socket_name], node.outputs[0])
+
+        for socket_name, img, extra in wires:
+            if socket_name == 'Displacement':
+                links.new(output_node.inputs[2], group_node.outputs[socket_name])
+            else:
+                links.new(
+                    Utils.get_shader_input(target_shader_node, socket_name),
+                    group_node.outputs[socket_name]
+                )
+
+        return len(wires)
+
+
 class SubstancePullTexturesOperator(bpy.types.Operator):
     bl_idname = bl_info["operator_id_prefix"] + ".substance_pull_textures"
     bl_label = "Pull Substance Painter Textures"
@@ -455,91 +4098,128 @@ class SubstancePullTexturesOperator(bpy.types.Operator):
     force_pull = BoolProperty(default=False)
 
     @classmethod
-    def get_image(self, texture_export_path, file_name):
+    def get_image(self, texture_export_path, file_name, cache=None):
         path_to_texture = os.path.join(
             texture_export_path,
             file_name
         )
 
-        return bpy.data.images.load(path_to_texture)
-
-    @classmethod
-    def get_matched_image(self, texture_export_path, image_files, socket):
-        for tag in socket[1]:
-            for image in image_files:
-                image_name = image['name'].lower()
-                if tag in image_name:
-                    file_name = image['name']
-                    extra = None
+        if cache is None:
+            cache = ImageCache()
 
-                    if socket[0] == 'Roughness':
-                        for special_tag in self.gloss_tag.split(' '):
-                            if special_tag in image_name:
-                                extra = 'IS_GLOSS'
-                                break
-                    elif socket[0] == 'Normal':
-                        for special_tag in self.bump_tag.split(' '):
-                            if special_tag in image_name:
-                                extra = 'IS_BUMP'
-                                break
+        return cache.load(path_to_texture)
 
-                    return self.get_image(texture_export_path, file_name), extra
+    @classmethod
+    def get_matched_image(self, texture_export_path, index, material_name, socket, cache=None):
+        match = index.get(material_name, socket[0])
+        if match:
+            return self.get_image(texture_export_path, match['name'], cache), match['extra']
 
         return None, None
 
     @classmethod
-    def match_material_slot_with_textures(self, context, texture_export_path, material_name: str):
+    @Profiler.timed("node_setup")
+    def match_material_slot_with_textures(self, context, texture_export_path, material_name: str, index=None, cache=None):
+        if index is None:
+            index = TextureIndex.load(texture_export_path)
+        if cache is None:
+            cache = ImageCache()
 
         # We get all the node tree for current material
         mat = bpy.data.materials[material_name]
         mat.use_nodes = True
-        
+
         node_tree = mat.node_tree
         nodes = node_tree.nodes
         links = node_tree.links
 
-        target_shader_node = [
-            n for n in nodes if n.bl_idname == 'ShaderNodeBsdfPrincipled'
-        ][0]
-        output_node = [
-            n for n in nodes if n.bl_idname == 'ShaderNodeOutputMaterial'
-        ][0]
+        target_shader_node = next(
+            (n for n in nodes if n.bl_idname == 'ShaderNodeBsdfPrincipled'), None)
+        output_node = next(
+            (n for n in nodes if n.bl_idname == 'ShaderNodeOutputMaterial'), None)
 
-        m_files = []
-        for filename in os.listdir(texture_export_path):
-            filenames = filename.split('_')
-            is_target_material = filenames[0] == material_name
-
-            if (not is_target_material and len(filenames) > 1):
-                is_target_material = filenames[1] == material_name
-
-            if filename.endswith(".png") and is_target_material:
-                m_files.append({'name': filename})
-            else:
-                continue
+        if not target_shader_node or not output_node:
+            print("No Principled BSDF setup in " + material_name)
+            return None
 
         mapping = None
         texture_input = None
-        index = 0
+        node_index = 0
 
-        print("Textures found: " + str(len(m_files)))
+        print("Textures found: " + str(index.count(material_name)))
 
+        def is_free(socket_name):
+            if socket_name == 'Displacement':
+                return not output_node.inputs[2].is_linked
+            socket = Utils.get_shader_input(target_shader_node, socket_name)
+            return socket is not None and not socket.is_linked
+
+        configs = context.scene.taper_configs
+
+        constants = {}
+        if configs.flatten_constant_maps:
+            # Only sockets this Blender's Principled BSDF has can take a value
+            sockets = [
+                socket[0] for socket in self.socketnames
+                if socket[0] == 'Displacement' or Utils.get_shader_input(target_shader_node, socket[0])
+            ]
+            constants = TextureStats.load(texture_export_path).get_constants(
+                index,
+                material_name,
+                [socket_name for socket_name in sockets if is_free(socket_name)]
+            )
+            for socket_name, value in constants.items():
+                if value is not None:
+                    Utils.get_shader_input(target_shader_node, socket_name).default_value = value
+            if constants:
+                print("Constant maps flattened: " + str(len(constants)))
+
+        packed_image, packed_channels = None, {}
+        if configs.pack_channels:
+            packed_image, packed_channels = ChannelPacker.pack(
+                texture_export_path,
+                material_name,
+                index,
+                cache,
+                [s for s in ChannelPacker.layout if is_free(s) and not s in constants]
+            )
+        packed_outputs = None
+
+        wires = []
         for socket in self.socketnames:
-            img, extra = self.get_matched_image(
-                texture_export_path, m_files, socket)
             socket_name = socket[0]
+            # Links are checked only for matched maps, the sockets of the
+            # rest may not exist on this Blender's Principled BSDF
+            if socket_name in constants or not index.get(material_name, socket_name) \
+                    or not is_free(socket_name):
+                continue
+            elif socket_name in packed_channels:
+                img, extra = packed_image, index.get(material_name, socket_name)['extra']
+            else:
+                img, extra = self.get_matched_image(
+                    texture_export_path, index, material_name, socket, cache)
+
+            if not img == None:
+                if socket_name in packed_channels:
+                    ImageHeader.set_value(img.colorspace_settings, "name", 'Non-Color')
+                else:
+                    ImageHeader.configure(img, socket_name == 'Base Color')
+                wires.append((socket_name, img, extra))
+
+        if configs.use_node_groups and wires:
+            return NodeTemplates.build(
+                node_tree, target_shader_node, output_node, wires, packed_channels)
 
-            if (not img == None) and not (not socket_name == 'Displacement' and target_shader_node.inputs[socket_name].is_linked) and not (socket_name == 'Displacement' and output_node.inputs[2].is_linked):
+        for socket_name, img, extra in wires:
+            if socket_name in packed_channels and packed_outputs:
+                node = packed_outputs[0]
+            else:
                 node = nodes.new(type='ShaderNodeTexImage')
                 node.location = (target_shader_node.location.x -
-                                 400, target_shader_node.location.y + -300 * index)
-                index += 1
-                node.label = socket_name
+                                 400, target_shader_node.location.y + -300 * node_index)
+                node.label = "Packed" if socket_name in packed_channels else socket_name
                 node.image = img
 
-                if not socket_name == 'Base Color':
-                    img.colorspace_settings.name = 'Non-Color'
-
                 if not mapping and not texture_input:
                     mapping = nodes.new(type='ShaderNodeMapping')
                     mapping.location = (target_shader_node.location.x - 850, 0)
@@ -552,46 +4232,83 @@ class SubstancePullTexturesOperator(bpy.types.Operator):
 
                 # Link mapping node
                 links.new(node.inputs[0], mapping.outputs[0])
+            node_index += 1
+
+            output = node.outputs[0]
+            if socket_name in packed_channels:
+                if not packed_outputs:
+                    # Separate Color replaced Separate RGB in Blender 3.3
+                    separate = nodes.new(
+                        type='ShaderNodeSeparateColor' if hasattr(bpy.types, 'ShaderNodeSeparateColor')
+                        else 'ShaderNodeSeparateRGB')
+                    separate.location = (node.location.x + 200, node.location.y)
+                    links.new(separate.inputs[0], node.outputs[0])
+                    packed_outputs = (
+                        node, [separate.outputs[i] for i in range(3)] + [node.outputs[1]])
+                output = packed_outputs[1][packed_channels[socket_name]]
+
+            shader_input = Utils.get_shader_input(target_shader_node, socket_name)
+            if not socket_name in ['Displacement', 'Normal']:
+                links.new(shader_input, output)
+
+            if socket_name == 'Displacement':
+                disp_node = nodes.new(type='ShaderNodeDisplacement')
+                disp_node.location = (
+                    node.location.x + 400, node.location.y)
+                # We link the tex node to the displacement node
+                links.new(disp_node.inputs[0], output)
+                # We link the displacement node to the material output node
+                links.new(output_node.inputs[2], disp_node.outputs[0])
+
+            elif socket_name == 'Normal':
+                if extra == 'IS_BUMP':
+                    normal_node = nodes.new(type='ShaderNodeBump')
+                    links.new(normal_node.inputs[2], output)
+                else:
+                    normal_node = nodes.new(type='ShaderNodeNormalMap')
+                    links.new(normal_node.inputs[1], output)
 
-                if not socket_name in ['Displacement', 'Normal']:
-                    links.new(
-                        target_shader_node.inputs[socket_name], node.outputs[0])
+                normal_node.location = (
+                    node.location.x + 400, node.location.y)
+                links.new(shader_input, normal_node.outputs[0])
 
-                if socket_name == 'Displacement':
-                    disp_node = nodes.new(type='ShaderNodeDisplacement')
-                    disp_node.location = (
-                        node.location.x + 400, node.location.y)
-                    # We link the tex node to the displacement node
-                    links.new(disp_node.inputs[0], node.outputs[0])
-                    # We link the displacement node to the material output node
-                    links.new(output_node.inputs[2], disp_node.outputs[0])
-
-                elif socket_name == 'Normal':
-                    if extra == 'IS_BUMP':
-                        normal_node = nodes.new(type='ShaderNodeBump')
-                        links.new(normal_node.inputs[2], node.outputs[0])
-                    else:
-                        normal_node = nodes.new(type='ShaderNodeNormalMap')
-                        links.new(normal_node.inputs[1], node.outputs[0])
-
-                    normal_node.location = (
+            elif socket_name == 'Roughness':
+                if extra == 'IS_GLOSS':
+                    invert_node = nodes.new(type='ShaderNodeInvert')
+                    links.new(invert_node.inputs[1], output)
+                    links.new(shader_input, invert_node.outputs[0])
+
+                    invert_node.location = (
                         node.location.x + 400, node.location.y)
-                    links.new(
-                        target_shader_node.inputs[socket_name], normal_node.outputs[0])
-
-                elif socket_name == 'Roughness':
-                    if extra == 'IS_GLOSS':
-                        invert_node = nodes.new(type='ShaderNodeInvert')
-                        links.new(invert_node.inputs[1], node.outputs[0])
-                        links.new(
-                            target_shader_node.inputs[socket_name], invert_node.outputs[0])
-
-                        invert_node.location = (
-                            node.location.x + 400, node.location.y)
-                    else:
-                        links.new(
-                            target_shader_node.inputs[socket_name], node.outputs[0])
 
+        return node_index
+
+    @classmethod
+    def pull(self, context, materials, texture_export_path):
+        # Scan the folder once and share loaded images for the whole batch
+        index = TextureIndex.load(texture_export_path)
+        cache = ImageCache(context.scene.taper_configs.verify_texture_hash)
+
+        num_textures = 0
+        skipped = []
+        for mat in materials:
+            num_linked = self.match_material_slot_with_textures(
+                context,
+                texture_export_path,
+                mat.name,
+                index,
+                cache
+            )
+            if num_linked is None:
+                skipped.append(mat.name)
+            else:
+                num_textures += num_linked
+
+        TextureStats.load(texture_export_path).save()
+
+        return num_textures, skipped, cache
+
+    @Profiler.operator
     def execute(self, context):
         texture_export_path = Utils.get_textures_export_path(
             context,
@@ -600,18 +4317,35 @@ class SubstancePullTexturesOperator(bpy.types.Operator):
 
         print(texture_export_path)
 
-        active_obj = bpy.context.view_layer.objects.active
-        if len(active_obj.data.materials) == 0:
-            self.report({'ERROR'}, "No material found in this selected object")
+        materials = Utils.get_target_materials(context, context.scene.taper_configs)
+        if len(materials) == 0:
+            self.report({'ERROR'}, "No material found in the selection")
         else:
-            for slot in active_obj.material_slots:
-                self.match_material_slot_with_textures(
-                    context,
-                    texture_export_path,
-                    slot.material.name
-                )
-
-        bpy.context.space_data.shading.type = 'RENDERED'
+            num_textures, skipped, cache = self.pull(
+                context, materials, texture_export_path)
+
+            self.report({'INFO'}, "Linked %d textures in %d materials" % (
+                num_textures, len(materials) - len(skipped)))
+            if skipped:
+                self.report({'WARNING'}, "No Principled BSDF in: " + ", ".join(skipped))
+
+            report = cache.get_report()
+            if report:
+                self.report({'INFO'}, report)
+
+            configs = context.scene.taper_configs
+            if configs.use_proxies:
+                images = set()
+                for mat in materials:
+                    if not mat.name in skipped:
+                        images.update(SubstanceUpdateTexturesOperator.get_node_images(mat.name))
+
+                num_proxies = TextureProxies.request(
+                    images, int(configs.proxy_size), configs.export_workers)
+                if num_proxies:
+                    self.report({'INFO'}, "Building %d viewport proxies" % num_proxies)
+
+        Utils.show_rendered(context, context.scene.taper_configs)
         return {'FINISHED'}
 
 
@@ -622,11 +4356,11 @@ class SubstanceUpdateTexturesOperator(bpy.types.Operator):
     image_types = ["IMAGE", "TEX_IMAGE", "TEX_ENVIRONMENT", "TEXTURE"]
 
     @classmethod
-    def reload_node_images(self, material_name):
+    def get_node_images(self, material_name):
         node_tree = bpy.data.materials[material_name].node_tree
         nodes = node_tree.nodes
 
-        num_reloaded = 0
+        images = []
 
         for node in nodes:
             if node.type in self.image_types:
@@ -634,32 +4368,599 @@ class SubstanceUpdateTexturesOperator(bpy.types.Operator):
                     if node.texture:  # node has texture assigned
                         if node.texture.type in ['IMAGE', 'ENVIRONMENT_MAP']:
                             if node.texture.image:  # texture has image assigned
-                                node.texture.image.reload()
-                                num_reloaded += 1
+                                images.append(node.texture.image)
                 else:
                     if node.image:
-                        node.image.reload()
-                        num_reloaded += 1
+                        images.append(node.image)
+
+        return images
+
+    @classmethod
+    @Profiler.timed("image_reload")
+    def reload_node_images(self, material_name, use_hash=False, counts=None, seen=None):
+        if counts is None:
+            counts = {'CHANGED': 0, 'UNCHANGED': 0, 'MISSING': 0}
+        if seen is None:
+            seen = set()
+
+        for image in self.get_node_images(material_name):
+            # Only file backed images can be compared with disk
+            if image in seen or not image.source in ['FILE', 'TILED'] or image.packed_file:
+                continue
+            seen.add(image)
+
+            ChannelPacker.refresh(image)
+
+            path = ImageManifest.get_image_path(image)
+            status = ImageManifest.check(image, path, use_hash)
+            if status == 'CHANGED':
+                ImageManifest.reload(image, path, use_hash)
+
+            counts[status] += 1
+
+        return counts
+
+    @Profiler.operator
+    def execute(self, context):
+        use_hash = context.scene.taper_configs.verify_texture_hash
+
+        materials = Utils.get_target_materials(context, context.scene.taper_configs)
+        if len(materials) == 0:
+            self.report({'ERROR'}, "No material found in the selection")
+        else:
+            counts = {'CHANGED': 0, 'UNCHANGED': 0, 'MISSING': 0}
+            seen = set()
+            for mat in materials:
+                if mat.node_tree:
+                    self.reload_node_images(
+                        mat.name,
+                        use_hash,
+                        counts,
+                        seen
+                    )
+
+            if seen:
+                self.report({'INFO'}, "Textures: %d changed, %d unchanged, %d missing" % (
+                    counts['CHANGED'], counts['UNCHANGED'], counts['MISSING']))
+            else:
+                self.report(
+                    {'WARNING'}, "No images found to reload in this node tree")
+
+        return {'FINISHED'}
+
+
+class RenderFullTexturesOperator(bpy.types.Operator):
+    bl_idname = bl_info["operator_id_prefix"] + ".render_full_textures"
+    bl_label = "Render Full Textures"
+    bl_description = "Swap the texture proxies for the full files, render, then swap them back"
+
+    def execute(self, context):
+        # Swapped here, before the render job holds the images
+        TextureProxies.rendering = True
+        TextureProxies.swap_all(False)
 
-        return num_reloaded
+        if 'CANCELLED' in bpy.ops.render.render('INVOKE_DEFAULT'):
+            TextureProxies.resume_after_render()
+            return {'CANCELLED'}
+        return {'FINISHED'}
+
+
+class SubstancePurgeImagesOperator(bpy.types.Operator):
+    bl_idname = bl_info["operator_id_prefix"] + ".substance_purge_images"
+    bl_label = "Purge Duplicate Images"
+    bl_description = "Merge images loaded more than once from the same file"
+    bl_options = {"REGISTER", "UNDO"}
 
+    @Profiler.operator
     def execute(self, context):
-        active_obj = bpy.context.view_layer.objects.active
-        if len(active_obj.data.materials) == 0:
-            self.report({'ERROR'}, "No material found in this selected object")
+        cache = ImageCache()
+        cache.purge()
+
+        report = cache.get_report()
+        if report:
+            self.report({'INFO'}, report)
         else:
-            for slot in active_obj.material_slots:
-                num_reloaded = self.reload_node_images(
-                    slot.material.name
+            self.report({'INFO'}, "No duplicate images found")
+
+        return {'FINISHED'}
+
+
+class TextureAtlas(object):
+
+    folder = ".taper_cache"
+    key = "taper_atlas"
+    uv_name = "Taper Source UV"
+    version = 2
+    # Page channel names, parsed back by the texture index like a Painter export
+    channels = {
+        'Base Color': "BaseColor",
+        'Subsurface Color': "Subsurface",
+        'Metallic': "Metallic",
+        'Specular': "Specular",
+        'Roughness': "Roughness",
+        'Normal': "Normal",
+        'Displacement': "Height"
+    }
+    color_channels = ['Base Color', 'Subsurface Color']
+    # Page background, rectangles of materials without a map take their own socket value
+    fill = {
+        'Base Color': 0.8,
+        'Subsurface Color': 0.0,
+        'Metallic': 0.0,
+        'Specular': 0.5,
+        'Roughness': 0.5,
+        'Normal': (0.5, 0.5, 1.0),
+        'Displacement': 0.5
+    }
+
+    @staticmethod
+    def get_name(collection):
+        # Painter splits texture names on '_', the page materials must not contain it
+        return "Atlas" + re.sub(r'[^0-9A-Za-z]', '', collection.name)
+
+    @classmethod
+    def get_page_path(cls, texture_export_path, name, page, socket_name):
+        return os.path.join(
+            texture_export_path, "%s%d_%s.png" % (name, page, cls.channels[socket_name]))
+
+    @staticmethod
+    def to_srgb(value):
+        if value <= 0.0031308:
+            return value * 12.92
+        return 1.055 * value ** (1.0 / 2.4) - 0.055
+
+    @staticmethod
+    def get_uv_layer(mesh):
+        # Rendering and export read the render UV map, not the one being edited
+        return next((layer for layer in mesh.uv_layers if layer.active_render), mesh.uv_layers.active)
+
+    @staticmethod
+    def get_shader_nodes(mat):
+        if not mat or not mat.node_tree:
+            return None, None
+        nodes = mat.node_tree.nodes
+        return (
+            next((n for n in nodes if n.bl_idname == 'ShaderNodeBsdfPrincipled'), None),
+            next((n for n in nodes if n.bl_idname == 'ShaderNodeOutputMaterial'), None)
+        )
+
+    @classmethod
+    def get_sockets(cls, shader):
+        # Blender 4.x has no Subsurface Color, its pages would never be linked
+        return [
+            socket_name for socket_name in cls.channels
+            if socket_name == 'Displacement' or Utils.get_shader_input(shader, socket_name)
+        ]
+
+    @classmethod
+    def get_fills(cls, mat, sources):
+        # Channels without a map keep the material's own value, a link to
+        # anything else cannot be baked into the page
+        shader, output = cls.get_shader_nodes(mat)
+        fills = {}
+        for socket_name in cls.get_sockets(shader):
+            if socket_name in sources:
+                continue
+
+            if socket_name == 'Displacement':
+                if output.inputs[2].is_linked:
+                    return None
+                fills[socket_name] = [cls.fill[socket_name]] * 3
+                continue
+
+            socket = Utils.get_shader_input(shader, socket_name)
+            if socket.is_linked:
+                return None
+            if socket_name == 'Normal':
+                fills[socket_name] = list(cls.fill[socket_name])
+            elif socket_name in cls.color_channels:
+                # The socket is linear, color pages hold sRGB like the Painter exports
+                fills[socket_name] = [cls.to_srgb(value) for value in socket.default_value[:3]]
+            else:
+                fills[socket_name] = [socket.default_value] * 3
+
+        return fills
+
+    @classmethod
+    def get_sources(cls, texture_export_path, index, material_name, max_size, sockets):
+        # Only small untiled 8 bit sets share a page, anything else keeps its material
+        sources = {}
+        size = (0, 0)
+        for socket_name in sockets:
+            match = index.get(material_name, socket_name)
+            if not match:
+                continue
+            if match['tiles'] or match['extra'] == 'IS_BUMP':
+                return None, None
+
+            path = os.path.join(texture_export_path, match['name'])
+            header = ImageHeader.probe(path)
+            if not header or header["is_float"] or max(header["width"], header["height"]) > max_size:
+                return None, None
+
+            stat = os.stat(path)
+            sources[socket_name] = [match['name'], stat.st_mtime_ns, stat.st_size, match['extra']]
+            size = (max(size[0], header["width"]), max(size[1], header["height"]))
+
+        if not sources:
+            return None, None
+        return sources, size
+
+    @classmethod
+    def get_uv_bounds(cls, meshes):
+        # UVs outside 0-1 repeat the texture, which a page rectangle cannot do
+        bounds = {}
+        for mesh in meshes:
+            uv_layer = cls.get_uv_layer(mesh)
+            if not uv_layer or not mesh.polygons:
+                continue
+
+            uv, slots = cls.get_loop_data(mesh, uv_layer)
+            for slot, mat in enumerate(mesh.materials):
+                mask = slots == slot
+                if mat and mask.any():
+                    low, high = bounds.get(mat.name, (np.inf, -np.inf))
+                    bounds[mat.name] = (min(low, uv[mask].min()), max(high, uv[mask].max()))
+
+        return {name: low > -0.001 and high < 1.001 for name, (low, high) in bounds.items()}
+
+    @staticmethod
+    def get_loop_data(mesh, uv_layer, faces=None):
+        uv = np.empty(len(mesh.loops) * 2, dtype=np.float32)
+        uv_layer.data.foreach_get("uv", uv)
+
+        if faces is None:
+            faces = np.empty(len(mesh.polygons), dtype=np.int32)
+            mesh.polygons.foreach_get("material_index", faces)
+        loop_totals = np.empty(len(mesh.polygons), dtype=np.int32)
+        mesh.polygons.foreach_get("loop_total", loop_totals)
+
+        # Polygons store their loops in order, so repeating each face index lines them up
+        return uv.reshape(-1, 2), np.repeat(faces, loop_totals)
+
+    @staticmethod
+    def pack_shelves(sizes, page_size, padding):
+        # Tallest first, each shelf is as tall as the first rectangle placed on it
+        rects = {}
+        page, x, y, shelf = 0, 0, 0, 0
+        for name, (width, height) in sorted(sizes.items(), key=lambda item: (-item[1][1], -item[1][0], item[0])):
+            cell_width, cell_height = width + 2 * padding, height + 2 * padding
+            if x + cell_width > page_size:
+                x, y, shelf = 0, y + shelf, 0
+            if y + cell_height > page_size:
+                page, x, y, shelf = page + 1, 0, 0, 0
+
+            rects[name] = [page, x + padding, y + padding, width, height]
+            x += cell_width
+            shelf = max(shelf, cell_height)
+
+        return rects, page + 1
+
+    @staticmethod
+    def read_pixels(path, size, invert=False):
+        image = bpy.data.images.load(path, check_existing=False)
+        try:
+            image.colorspace_settings.name = 'Non-Color'
+            pixels = np.empty(len(image.pixels), dtype=np.float32)
+            image.pixels.foreach_get(pixels)
+            width, height = image.size
+            pixels = pixels.reshape(height, width, image.channels)
+        finally:
+            bpy.data.images.remove(image)
+
+        if pixels.shape[2] < 3:
+            pixels = pixels[:, :, [0, 0, 0]]
+        pixels = pixels[:, :, :3]
+
+        # Nearest neighbour, smaller maps of a set are stretched to its largest one
+        if not (width, height) == size:
+            rows = np.arange(size[1]) * height // size[1]
+            cols = np.arange(size[0]) * width // size[0]
+            pixels = pixels[rows][:, cols]
+
+        if invert:
+            # Gloss maps are stored as roughness, the page has a single meaning
+            pixels = 1.0 - pixels
+        return pixels
+
+    @classmethod
+    def build_page(cls, texture_export_path, image_path, socket_name, materials, rects, page, page_size, padding):
+        pixels = np.empty((page_size, page_size, 4), dtype=np.float32)
+        pixels[:, :, :3] = cls.fill[socket_name]
+        pixels[:, :, 3] = 1.0
+
+        for material_name, texture_set in materials.items():
+            rect = rects[material_name]
+            if not rect[0] == page:
+                continue
+
+            x, y, width, height = rect[1:]
+            sources = texture_set["sources"]
+            if not socket_name in sources:
+                # Padding included, the value is constant anyway
+                pixels[y - padding:y + height + padding, x - padding:x + width + padding, :3] = \
+                    texture_set["fills"].get(socket_name, cls.fill[socket_name])
+                continue
+
+            name, mtime, size, extra = sources[socket_name]
+            block = cls.read_pixels(
+                os.path.join(texture_export_path, name), (width, height), extra == 'IS_GLOSS')
+
+            # Edge pixels are repeated into the padding so mipmaps do not bleed
+            pixels[y - padding:y + height + padding, x - padding:x + width + padding, :3] = np.pad(
+                block, ((padding, padding), (padding, padding), (0, 0)), mode='edge')
+
+        image = bpy.data.images.new("Taper Atlas", page_size, page_size, alpha=True)
+        try:
+            if not socket_name in cls.color_channels:
+                image.colorspace_settings.name = 'Non-Color'
+            image.pixels.foreach_set(pixels.ravel())
+            image.filepath_raw = image_path
+            image.file_format = 'PNG'
+            image.save()
+        finally:
+            bpy.data.images.remove(image)
+
+    @classmethod
+    def get_paged_sockets(cls, materials):
+        # A channel needs pages when a material has a map for it or the values differ
+        sockets = []
+        for socket_name in cls.channels:
+            values = set(
+                tuple(texture_set["fills"][socket_name]) for texture_set in materials.values()
+                if socket_name in texture_set["fills"]
+            )
+            if len(values) > 1 or any(
+                    socket_name in texture_set["sources"] for texture_set in materials.values()):
+                sockets.append(socket_name)
+        return sockets
+
+    @classmethod
+    def update(cls, texture_export_path, name, materials, page_size, padding):
+        entry_path = os.path.join(texture_export_path, cls.folder, name + ".json")
+        entry = ChannelPacker.read_entry(entry_path)
+        sizes = {material_name: size for material_name, (texture_set, size) in materials.items()}
+        materials = {material_name: texture_set for material_name, (texture_set, size) in materials.items()}
+        sockets = cls.get_paged_sockets(materials)
+
+        # Rebuild only when a source file, a socket value or the page settings changed
+        if entry and entry["version"] == cls.version and entry["sources"] == materials \
+                and entry["page_size"] == page_size and entry["padding"] == padding \
+                and all(os.path.isfile(cls.get_page_path(texture_export_path, name, page, s))
+                        for page in range(entry["pages"]) for s in entry["sockets"]):
+            return entry["rects"], entry["pages"]
+
+        rects, pages = cls.pack_shelves(sizes, page_size, padding)
+
+        # Pages of an earlier, larger layout would be picked up by the texture index
+        if entry:
+            for page in range(entry["pages"]):
+                for socket_name in entry["sockets"]:
+                    if page >= pages or not socket_name in sockets:
+                        path = cls.get_page_path(texture_export_path, name, page, socket_name)
+                        if os.path.isfile(path):
+                            os.remove(path)
+
+        for page in range(pages):
+            for socket_name in sockets:
+                cls.build_page(
+                    texture_export_path,
+                    cls.get_page_path(texture_export_path, name, page, socket_name),
+                    socket_name,
+                    materials,
+                    rects,
+                    page,
+                    page_size,
+                    padding
                 )
 
-                if num_reloaded:
-                    self.report({'INFO'}, "Reloaded images")
-                    print("Reloaded " + str(num_reloaded) + " images")
-                else:
-                    self.report(
-                        {'WARNING'}, "No images found to reload in this node tree")
+        Utils.ensure_path(os.path.dirname(entry_path))
+        entry = {
+            "version": cls.version,
+            "sources": materials,
+            "page_size": page_size,
+            "padding": padding,
+            "sockets": sockets,
+            "rects": rects,
+            "pages": pages
+        }
+        temp_path = entry_path + ".tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(entry, f)
+        os.replace(temp_path, entry_path)
+
+        return rects, pages
+
+    @classmethod
+    def restore(cls, mesh):
+        # Puts back the slots and UVs from before the last atlas build
+        entry = mesh.get(cls.key)
+        if not entry:
+            return False
+
+        mesh.materials.clear()
+        for name in entry["materials"]:
+            mesh.materials.append(bpy.data.materials.get(name) if name else None)
+        # Clearing the slots reset every face to the first one
+        mesh.polygons.foreach_set("material_index", np.array(entry["faces"], dtype=np.int32))
+
+        source = mesh.uv_layers.get(cls.uv_name)
+        target = mesh.uv_layers.get(entry["uv"])
+        if source and target:
+            uv = np.empty(len(mesh.loops) * 2, dtype=np.float32)
+            source.data.foreach_get("uv", uv)
+            target.data.foreach_set("uv", uv)
+        if source:
+            mesh.uv_layers.remove(source)
+
+        del mesh[cls.key]
+        mesh.update()
+        return True
+
+    @classmethod
+    def remap(cls, mesh, rects, page_materials, page_size):
+        uv_layer = cls.get_uv_layer(mesh)
+        slots = [mat.name if mat else "" for mat in mesh.materials]
+        if not uv_layer or not any(name in rects for name in slots):
+            return False
+
+        faces = np.empty(len(mesh.polygons), dtype=np.int32)
+        mesh.polygons.foreach_get("material_index", faces)
+
+        # The original UVs stay on the side so the atlas can be rebuilt or undone
+        uv_name = uv_layer.name
+        active_name = mesh.uv_layers.active.name
+        source = mesh.uv_layers.new(name=cls.uv_name, do_init=False)
+        if not source:
+            print("No free UV map left on " + mesh.name)
+            return False
+        # Adding a layer reallocates the others, the old references are stale
+        uv_layer = mesh.uv_layers[uv_name]
+        mesh.uv_layers.active = mesh.uv_layers[active_name]
+        uv_layer.active_render = True
+
+        uv, loop_slots = cls.get_loop_data(mesh, uv_layer, faces)
+        source.data.foreach_set("uv", uv.ravel())
+        mesh[cls.key] = {"materials": slots, "faces": faces.tolist(), "uv": uv_name}
+
+        # Atlased slots collapse into one slot per page
+        materials = []
+        remap = np.zeros(max(len(slots), 1), dtype=np.int32)
+        for slot, name in enumerate(slots):
+            rect = rects.get(name)
+            if rect:
+                page, x, y, width, height = rect
+                mask = loop_slots == slot
+                uv[mask] = (np.clip(uv[mask], 0.0, 1.0) * (width, height) + (x, y)) / page_size
+                mat = page_materials[page]
+            else:
+                mat = mesh.materials[slot]
+
+            if not mat in materials:
+                materials.append(mat)
+            remap[slot] = materials.index(mat)
+
+        uv_layer.data.foreach_set("uv", uv.ravel())
+        mesh.materials.clear()
+        for mat in materials:
+            mesh.materials.append(mat)
+        mesh.polygons.foreach_set("material_index", remap[np.clip(faces, 0, len(remap) - 1)])
+
+        mesh.update()
+        return True
+
+    @classmethod
+    def get_page_material(cls, context, texture_export_path, name, index, cache, constants):
+        mat = bpy.data.materials.get(name)
+        if mat is None:
+            mat = bpy.data.materials.new(name)
+        mat.use_nodes = True
+
+        SubstanceCleanNodeOperator.clean([mat])
+        SubstancePullTexturesOperator.match_material_slot_with_textures(
+            context, texture_export_path, name, index, cache)
+
+        # Channels every material had the same value for need no page
+        shader, output = cls.get_shader_nodes(mat)
+        for socket_name, value in constants.items():
+            socket = Utils.get_shader_input(shader, socket_name)
+            if socket is None or socket_name in ['Normal', 'Displacement']:
+                continue
+            if socket_name in cls.color_channels:
+                socket.default_value = [TextureStats.to_linear(c) for c in value] + [1.0]
+            else:
+                socket.default_value = value[0]
+        return mat
+
+    @classmethod
+    @Profiler.timed("texture_atlas")
+    def build(cls, context, collection, configs: Configs):
+        texture_export_path = Utils.get_textures_export_path(context, configs)
+        meshes = MeshPrep.get_unique_meshes(
+            [obj for obj in collection.all_objects if obj.type == 'MESH' and not obj.data.library])
+        for mesh in meshes:
+            cls.restore(mesh)
+
+        page_size = int(configs.atlas_size)
+        padding = configs.atlas_padding
+        max_size = min(configs.atlas_max_texture, page_size - 2 * padding)
+
+        index = TextureIndex.load(texture_export_path)
+        in_range = cls.get_uv_bounds(meshes)
+        materials = {}
+        for material_name, fits in sorted(in_range.items()):
+            mat = bpy.data.materials.get(material_name)
+            shader, output = cls.get_shader_nodes(mat)
+            if not fits or not shader or not output:
+                continue
+
+            sources, size = cls.get_sources(
+                texture_export_path, index, material_name, max_size, cls.get_sockets(shader))
+            fills = cls.get_fills(mat, sources) if sources else None
+            if fills is not None:
+                materials[material_name] = ({"sources": sources, "fills": fills}, size)
+
+        if len(materials) < 2:
+            return None, "Fewer than two materials with small texture sets in " + collection.name
+
+        name = cls.get_name(collection)
+        rects, pages = cls.update(texture_export_path, name, materials, page_size, padding)
+
+        # The folder changed when pages were written, the index rescans it
+        index = TextureIndex.load(texture_export_path)
+        cache = ImageCache(configs.verify_texture_hash)
+        paged = cls.get_paged_sockets({key: texture_set for key, (texture_set, size) in materials.items()})
+        constants = {}
+        for texture_set, size in materials.values():
+            for socket_name, value in texture_set["fills"].items():
+                if not socket_name in paged:
+                    constants[socket_name] = value
+        page_materials = [
+            cls.get_page_material(
+                context, texture_export_path, "%s%d" % (name, page), index, cache, constants)
+            for page in range(pages)
+        ]
+
+        remapped = sum(1 for mesh in meshes if cls.remap(mesh, rects, page_materials, page_size))
+        return {"materials": len(rects), "pages": pages, "meshes": remapped}, None
+
+
+class SubstanceAtlasOperator(bpy.types.Operator):
+    bl_idname = bl_info["operator_id_prefix"] + ".substance_atlas"
+    bl_label = "Build Texture Atlas"
+    bl_description = "Pack the small texture sets of the active collection into shared atlas pages"
+    bl_options = {"REGISTER", "UNDO"}
+
+    mode: EnumProperty(
+        name="Mode",
+        items=[
+            ('BUILD', "Build", "Pack the texture sets, remap UVs and merge the materials"),
+            ('RESTORE', "Restore", "Put back the materials and UVs from before the atlas")
+        ],
+        default='BUILD'
+    )
+
+    @Profiler.operator
+    def execute(self, context):
+        configs = context.scene.taper_configs
+        collection = context.view_layer.active_layer_collection.collection
+
+        if self.mode == 'RESTORE':
+            meshes = MeshPrep.get_unique_meshes(
+                [obj for obj in collection.all_objects if obj.type == 'MESH' and not obj.data.library])
+            restored = sum(1 for mesh in meshes if TextureAtlas.restore(mesh))
+            self.report({'INFO'}, "Restored %d meshes" % restored)
+            return {'FINISHED'}
+
+        result, error = TextureAtlas.build(context, collection, configs)
+        if error:
+            self.report({'ERROR'}, error)
+            return {'CANCELLED'}
+
+        self.report({'INFO'}, "Atlased %d materials into %d pages on %d meshes" % (
+            result["materials"], result["pages"], result["meshes"]))
 
+        Utils.show_rendered(context, configs)
         return {'FINISHED'}
 
 
@@ -681,7 +4982,8 @@ class TaperSubstanceLinkPanel(bpy.types.Panel):
             SubstanceLinkOperator.bl_idname,
             text="Send to Painter"
         )
-        layout.label(text="Active Selection")
+        layout.label(text="Materials")
+        layout.prop(configs, "batch_scope", text="")
         col = layout.column(align=True)
         col.operator(
             SubstancePullTexturesOperator.bl_idname,
@@ -695,16 +4997,205 @@ class TaperSubstanceLinkPanel(bpy.types.Panel):
             SubstanceUpdateTexturesOperator.bl_idname,
             text="Update Textures"
         )
+        col.operator(
+            SubstancePurgeImagesOperator.bl_idname,
+            text="Purge Duplicates"
+        )
+
+        layout.label(text="Atlas (Active Collection)")
+        row = layout.row(align=True)
+        row.operator(SubstanceAtlasOperator.bl_idname, text="Build Atlas").mode = 'BUILD'
+        row.operator(SubstanceAtlasOperator.bl_idname, text="Restore").mode = 'RESTORE'
+        row = layout.row(align=True)
+        row.prop(configs, "atlas_size", text="")
+        row.prop(configs, "atlas_max_texture")
+        row.prop(configs, "atlas_padding")
+
+        layout.prop(configs, "verify_texture_hash")
+        layout.prop(configs, "flatten_constant_maps")
+        layout.prop(configs, "pack_channels")
+        layout.prop(configs, "use_node_groups")
+        layout.prop(configs, "keep_shading")
+        row = layout.row(align=True)
+        row.prop(configs, "use_proxies")
+        row.prop(configs, "proxy_size", text="")
+        if configs.use_proxies:
+            layout.operator(RenderFullTexturesOperator.bl_idname)
+
+        col = layout.column(align=True)
+        col.prop(configs, "live_sync")
+        if configs.live_sync:
+            col.prop(configs, "live_sync_debounce")
+            if LiveSync.is_running():
+                col.label(text="Reloaded %d images" % LiveSync.reloaded)
 
         layout.label(text="Custom SP Project Folder")
         layout.prop(configs, "custom_sp_file", text="")
 
 
+class BatchProcessor(object):
+
+    tasks = ['export', 'pull', 'prep']
+    interval = 0.1
+
+    @staticmethod
+    def get_files(patterns):
+        files = []
+        for pattern in patterns:
+            pattern = os.path.expanduser(pattern)
+            if glob.has_magic(pattern):
+                matches = sorted(glob.glob(pattern, recursive=True))
+            else:
+                matches = [pattern]
+
+            for path in matches:
+                path = os.path.abspath(path)
+                if not path in files:
+                    files.append(path)
+
+        return files
+
+    @classmethod
+    def run(cls, files, task, jobs):
+        # Blender opens a missing file as an empty scene, fail those up front
+        missing = [path for path in files if not os.path.isfile(path)]
+        workers = [
+            BackgroundWorker("batch_task", {"task": task}, path, name=path)
+            for path in files if not path in missing
+        ]
+
+        start = time.perf_counter()
+        pool = WorkerPool(workers, jobs)
+        reported = set()
+        while True:
+            finished = pool.poll()
+            for worker in pool.workers:
+                if worker.done and not worker in reported:
+                    reported.add(worker)
+                    print("[%d/%d] %s %s in %.2fs" % (
+                        len(reported), len(workers),
+                        "FAILED" if worker.error else "OK", worker.name, worker.elapsed))
+            if finished:
+                break
+            time.sleep(cls.interval)
+
+        results = [
+            {
+                "file": worker.name,
+                "ok": worker.error is None,
+                "elapsed": worker.elapsed,
+                "result": worker.result,
+                "error": worker.error
+            }
+            for worker in workers
+        ] + [
+            {"file": path, "ok": False, "elapsed": 0.0, "result": None, "error": "File not found"}
+            for path in missing
+        ]
+
+        return {
+            "task": task,
+            "jobs": jobs,
+            "elapsed": time.perf_counter() - start,
+            "succeeded": sum(1 for result in results if result["ok"]),
+            "failed": sum(1 for result in results if not result["ok"]),
+            "files": results
+        }
+
+    @staticmethod
+    def get_collection_materials(layer_collection, seen=None):
+        # A material is pulled from the first collection found holding one of its objects
+        if seen is None:
+            seen = set()
+
+        materials = []
+        for obj in layer_collection.collection.objects:
+            for slot in obj.material_slots:
+                if slot.material and not slot.material in seen:
+                    seen.add(slot.material)
+                    materials.append(slot.material)
+
+        groups = [(layer_collection, materials)] if materials else []
+        for child in layer_collection.children:
+            groups += BatchProcessor.get_collection_materials(child, seen)
+        return groups
+
+    @staticmethod
+    def task_job(payload):
+        # Runs inside the background Blender process that opened the file
+        context = bpy.context
+        configs = context.scene.taper_configs
+        task = payload["task"]
+
+        if task == 'export':
+            path, error = Utils.get_export_path(configs=configs)
+            if path is None:
+                raise RuntimeError(error)
+
+            # The file is never saved, so these only apply to this run
+            configs.async_export = False
+            configs.parallel_export = False
+            # Path and worker errors cancel the operator, the file counts as failed
+            if not bpy.ops.taper.export_fbx_collections() == {'FINISHED'}:
+                raise RuntimeError("Export failed for " + bpy.data.filepath)
+            return {"path": path, "collections": len(CollectionExporter.get_batch_collections())}
+
+        if task == 'pull':
+            path, error = Utils.get_export_path(configs=configs)
+            if path is None:
+                raise RuntimeError(error)
+
+            # Every collection has its own Textures folder, the interactive pull
+            # finds it through the active collection, so each one is made active
+            view_layer = context.view_layer
+            results = {}
+            for layer_collection, materials in BatchProcessor.get_collection_materials(
+                    view_layer.layer_collection):
+                view_layer.active_layer_collection = layer_collection
+                path = Utils.get_textures_export_path(context, configs)
+                num_textures, skipped, cache = SubstancePullTexturesOperator.pull(
+                    context, materials, path)
+                results[layer_collection.name] = {
+                    "path": path, "textures": num_textures, "materials": len(materials), "skipped": skipped}
+
+            bpy.ops.wm.save_mainfile()
+            return {
+                "textures": sum(result["textures"] for result in results.values()),
+                "materials": sum(result["materials"] for result in results.values()),
+                "collections": results
+            }
+
+        if task == 'prep':
+            # Hidden helpers and cutters are left alone, as in the interactive operator
+            objects = [
+                obj for obj in context.view_layer.objects
+                if obj.type == 'MESH' and obj.visible_get() and not obj.data.library
+            ]
+            if objects:
+                MeshPrep.ensure_materials(objects, Utils.get_active_collection_name(context))
+                MeshNormals.process(MeshPrep.get_unique_meshes(objects), 'RECALC')
+                MeshPrep.unwrap(context, objects)
+            bpy.ops.wm.save_mainfile()
+            return {"objects": len(objects)}
+
+        raise ValueError("Unknown task " + task)
+
+
+# Jobs a BackgroundWorker can run inside a background Blender process
+worker_jobs = {
+    "export_fbx_collections": CollectionExporter.export_collections_job,
+    "export_fbx_active": CollectionExporter.export_active_job,
+    "smart_project": MeshPrep.smart_project_job,
+    "build_proxies": TextureProxies.build_proxies_job,
+    "batch_task": BatchProcessor.task_job,
+}
+
 classes = (
     TaperPreference,
     Configs,
     ExportFBXCollectionsOperator,
     ExportFBXActiveCollectionOperator,
+    ExportAsyncOperator,
     AutoNameUnwrapMaterialOperator,
     FlipNormalOperator,
     AutoCenterOperator,
@@ -712,7 +5203,11 @@ classes = (
     SubstancePullTexturesOperator,
     SubstanceCleanNodeOperator,
     SubstanceUpdateTexturesOperator,
+    SubstancePurgeImagesOperator,
+    RenderFullTexturesOperator,
+    SubstanceAtlasOperator,
     TaperExportPanel,
+    TaperDiagnosticsPanel,
     TaperSubstanceLinkPanel
 )
 
@@ -722,8 +5217,58 @@ m_register, m_unregister = bpy.utils.register_classes_factory(classes)
 def register():
     m_register()
     bpy.types.Scene.taper_configs = PointerProperty(type=Configs)
+    bpy.app.handlers.load_post.append(live_sync_load_post)
+    bpy.app.handlers.load_post.append(texture_proxy_load_post)
+    bpy.app.handlers.save_pre.append(texture_proxy_save_pre)
+    bpy.app.handlers.save_post.append(texture_proxy_save_post)
+    bpy.app.handlers.render_init.append(texture_proxy_render_init)
+    bpy.app.handlers.render_complete.append(texture_proxy_render_done)
+    bpy.app.handlers.render_cancel.append(texture_proxy_render_done)
 
 
 def unregister():
+    LiveSync.stop()
+    TextureProxies.cancel()
+    bpy.app.handlers.load_post.remove(live_sync_load_post)
+    bpy.app.handlers.load_post.remove(texture_proxy_load_post)
+    bpy.app.handlers.save_pre.remove(texture_proxy_save_pre)
+    bpy.app.handlers.save_post.remove(texture_proxy_save_post)
+    bpy.app.handlers.render_init.remove(texture_proxy_render_init)
+    bpy.app.handlers.render_complete.remove(texture_proxy_render_done)
+    bpy.app.handlers.render_cancel.remove(texture_proxy_render_done)
     del bpy.types.Scene.taper_configs
     m_unregister()
+
+
+def cli_main(argv=None):
+    # blender --background --python-expr "import sys, importlib; sys.path.insert(0, '<addons folder>');
+    #     importlib.import_module('Taper').cli_main()" -- --task export --jobs 4 "assets/**/*.blend"
+    if argv is None:
+        argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+
+    parser = argparse.ArgumentParser(
+        prog="taper", description="Run a Taper task over many .blend files")
+    parser.add_argument("files", nargs="+",
+                        help="Blend files or glob patterns, ** matches folders recursively")
+    parser.add_argument("--task", choices=BatchProcessor.tasks, default='export',
+                        help="export collections, pull textures or auto prep meshes")
+    parser.add_argument("--jobs", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="Files processed at the same time")
+    parser.add_argument("--out", help="Write the JSON summary to this file")
+    args = parser.parse_args(argv)
+
+    summary = BatchProcessor.run(
+        BatchProcessor.get_files(args.files), args.task, max(1, args.jobs))
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(summary, f, indent=2)
+    else:
+        print(json.dumps(summary, indent=2))
+
+    print("%d succeeded, %d failed in %.2fs" % (
+        summary["succeeded"], summary["failed"], summary["elapsed"]))
+    if summary["failed"]:
+        sys.exit(1)
+
+    return summary
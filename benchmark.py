@@ -0,0 +1,458 @@
+# Benchmarks for Taper's hot paths
+#
+# Inside Blender (full suite):
+#   blender --background --factory-startup --python benchmark.py -- --out results.json
+# Without Blender (filename matching and the Painter client, bpy is stubbed):
+#   python benchmark.py --stub --out results.json
+# Compare against an earlier run:
+#   python benchmark.py --stub --compare old.json
+import argparse
+import base64
+import http.server
+import importlib
+import json
+import os
+import platform
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import time
+import types
+import zlib
+
+
+ADDON_DIR = os.path.dirname(os.path.abspath(__file__))
+ADDON_NAME = os.path.basename(ADDON_DIR)
+
+CHANNELS = ["BaseColor", "Metallic", "Roughness", "Normal", "Height", "Mixed_AO", "Emissive"]
+
+
+def parse_args():
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+
+    parser = argparse.ArgumentParser(description="Taper benchmarks")
+    parser.add_argument("--stub", action="store_true",
+                        help="Run the pure Python suite with a bpy stub")
+    parser.add_argument("--collections", type=int, default=20)
+    parser.add_argument("--objects", type=int, default=5,
+                        help="Objects per collection")
+    parser.add_argument("--materials", type=int, default=200)
+    parser.add_argument("--grid", type=int, default=64,
+                        help="Grid resolution of each object mesh")
+    parser.add_argument("--extra-files", type=int, default=2000,
+                        help="Unrelated textures in the export folder")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--out", help="Write the JSON results to this file")
+    parser.add_argument("--compare", help="Earlier results to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Allowed slowdown before a result counts as a regression")
+    parser.add_argument("--keep", action="store_true",
+                        help="Keep the generated files")
+
+    return parser.parse_args(argv)
+
+
+def install_bpy_stub():
+    # Just enough of bpy for the addon module to import outside of Blender
+    class Stub(object):
+        def __init__(self, *args, **kwargs):
+            pass
+
+    def module(name, **attrs):
+        mod = types.ModuleType(name)
+        mod.__dict__.update(attrs)
+        sys.modules[name] = mod
+        return mod
+
+    def prop(*args, **kwargs):
+        return None
+
+    props = module("bpy.props", **{
+        name: prop for name in [
+            "BoolProperty", "EnumProperty", "FloatProperty", "IntProperty",
+            "StringProperty", "PointerProperty", "CollectionProperty"
+        ]
+    })
+    handlers = module("bpy.app.handlers", persistent=lambda f: f,
+                      load_post=[], render_init=[], render_complete=[], render_cancel=[])
+    app = module("bpy.app", handlers=handlers, version=(0, 0, 0),
+                 version_string="stub", binary_path="", background=True)
+    module(
+        "bpy",
+        props=props,
+        app=app,
+        types=types.SimpleNamespace(
+            AddonPreferences=Stub, PropertyGroup=Stub, Operator=Stub, Panel=Stub, Scene=Stub),
+        utils=types.SimpleNamespace(
+            register_classes_factory=lambda classes: (lambda: None, lambda: None))
+    )
+    module("bmesh")
+    module("mathutils", Matrix=Stub, Vector=Stub)
+
+
+def import_addon(stub):
+    sys.path.insert(0, os.path.dirname(ADDON_DIR))
+    if stub:
+        install_bpy_stub()
+        return importlib.import_module(ADDON_NAME)
+
+    import addon_utils
+    addon_utils.enable(ADDON_NAME, default_set=True)
+    return sys.modules[ADDON_NAME]
+
+
+def write_png(path, size=4, value=128):
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff)
+
+    raw = b"".join(b"\x00" + bytes([value]) * size for row in range(size))
+    with open(path, 'wb') as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", size, size, 8, 0, 0, 0, 0)))
+        f.write(chunk(b"IDAT", zlib.compress(raw)))
+        f.write(chunk(b"IEND", b""))
+
+
+def get_material_names(count):
+    # Painter splits texture names on '_', material names must not contain it
+    return ["Mat%04d" % i for i in range(count)]
+
+
+def build_texture_folder(root, args):
+    texture_dir = os.path.join(root, "Textures")
+    os.makedirs(texture_dir)
+
+    for name in get_material_names(args.materials):
+        for channel in CHANNELS:
+            write_png(os.path.join(texture_dir, "%s_%s.png" % (name, channel)))
+    for i in range(args.extra_files):
+        write_png(os.path.join(texture_dir, "Unused%05d_Opacity.png" % i))
+
+    return texture_dir
+
+
+class Benchmark(object):
+
+    def __init__(self, args):
+        self.args = args
+        self.results = {}
+
+    def measure(self, name, fn, setup=None, **params):
+        times = []
+        for run in range(self.args.repeat):
+            if setup:
+                setup()
+            start = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - start)
+
+        self.results[name] = dict(
+            min=min(times), mean=sum(times) / len(times), runs=len(times), **params)
+        print("%-32s %10.2f ms" % (name, min(times) * 1000))
+
+
+def legacy_match(texture_dir, material_names, socketnames):
+    # The per material listdir and tag x file loops the texture index replaced
+    for material_name in material_names:
+        m_files = []
+        for filename in os.listdir(texture_dir):
+            filenames = filename.split('_')
+            is_target_material = filenames[0] == material_name
+            if not is_target_material and len(filenames) > 1:
+                is_target_material = filenames[1] == material_name
+            if filename.endswith(".png") and is_target_material:
+                m_files.append(filename.lower())
+
+        for socket in socketnames:
+            next((f for tag in socket[1] for f in m_files if tag in f), None)
+
+
+def run_matching(bench, taper, texture_dir):
+    names = get_material_names(bench.args.materials)
+    socketnames = taper.SubstancePullTexturesOperator.socketnames
+    files = len(os.listdir(texture_dir))
+
+    def cold_scan():
+        taper.TextureIndex.cache.clear()
+        taper.TextureIndex.load(texture_dir)
+
+    def lookup():
+        index = taper.TextureIndex.load(texture_dir)
+        for name in names:
+            for socket in socketnames:
+                index.get(name, socket[0])
+
+    bench.measure("texture_index_scan", cold_scan, files=files)
+    bench.measure("texture_index_lookup", lookup, materials=len(names))
+    bench.measure("legacy_listdir_match",
+                  lambda: legacy_match(texture_dir, names, socketnames),
+                  materials=len(names), files=files)
+
+
+class PainterStandIn(object):
+    # Answers /run.json like Painter's remote scripting, so the client runs without Painter
+
+    def __init__(self, project_open=True):
+        self.project_open = project_open
+        self.scripts = []
+        stand_in = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+
+            def do_POST(self):
+                if not self.path == "/run.json":
+                    self.send_error(404)
+                    return
+
+                command = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                script = base64.b64decode(command["js"]).decode("utf-8")
+                stand_in.scripts.append(script)
+
+                if "alg.project.isOpen" in script:
+                    result = stand_in.project_open
+                elif "alg.project.reload" in script:
+                    result = None
+                else:
+                    result = {"error": "Unknown script"}
+
+                body = json.dumps(result).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(("localhost", 0), Handler)
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get_context(self, taper):
+        # Only the addon preferences are read on the way to the remote
+        preferences = types.SimpleNamespace(
+            painter_remote_port=self.port, reuse_painter_session=True)
+        return types.SimpleNamespace(preferences=types.SimpleNamespace(
+            addons={taper.__name__: types.SimpleNamespace(preferences=preferences)}))
+
+
+def run_painter_remote(bench, taper):
+    project_path, mesh_path = "Painter/Kit.spp", "Export/Kit.fbx"
+
+    with PainterStandIn() as painter:
+        context = painter.get_context(taper)
+        session = {"process": None, "fingerprint": None}
+
+        def update_mesh():
+            result, error = taper.PainterSession.update_mesh(
+                context, session, project_path, mesh_path, "fingerprint")
+            if error:
+                raise RuntimeError("Mesh update failed: " + error)
+
+        bench.measure("painter_update_mesh", update_mesh)
+        if not session["fingerprint"] == "fingerprint" or not any(
+                "alg.project.reload" in script for script in painter.scripts):
+            raise RuntimeError("Mesh update did not reach the stand-in")
+
+    # Another project open in Painter must not be reloaded
+    with PainterStandIn(project_open=False) as painter:
+        session = {"process": None, "fingerprint": None}
+        result, error = taper.PainterSession.update_mesh(
+            painter.get_context(taper), session, project_path, mesh_path, "fingerprint")
+        if error is None or any("alg.project.reload" in script for script in painter.scripts):
+            raise RuntimeError("Mesh reloaded into another Painter project")
+
+
+def check_nested_shards(taper):
+    # A parent and its child collection exported by different workers
+    class Objects(list):
+        def unlink(self, obj):
+            self.remove(obj)
+
+    class Collection(object):
+        def __init__(self, name, objects, children=()):
+            self.name = name
+            self.objects = Objects(objects)
+            self.children = list(children)
+
+    child = Collection("Child", ["ChildMesh"])
+    parent = Collection("Parent", ["ParentMesh"], [child])
+
+    for shard, kept, emptied in [({"Child"}, child, parent), ({"Parent"}, parent, child)]:
+        child.objects[:] = ["ChildMesh"]
+        parent.objects[:] = ["ParentMesh"]
+        taper.CollectionExporter.keep_shard([parent, child], shard)
+
+        if emptied.objects or not kept.objects or not parent.children == [child]:
+            raise RuntimeError("Shard %s broke the collection hierarchy" % ", ".join(shard))
+
+
+def build_scene(root, args, taper):
+    import bpy
+    import bmesh
+
+    scene = bpy.context.scene
+    materials = []
+    for name in get_material_names(args.materials):
+        mat = bpy.data.materials.new(name)
+        mat.use_nodes = True
+        materials.append(mat)
+
+    objects = []
+    for c in range(args.collections):
+        collection = bpy.data.collections.new("Coll%03d" % c)
+        scene.collection.children.link(collection)
+
+        for o in range(args.objects):
+            bm = bmesh.new()
+            bmesh.ops.create_grid(bm, x_segments=args.grid, y_segments=args.grid, size=1.0)
+            mesh = bpy.data.meshes.new("Mesh%03d_%02d" % (c, o))
+            bm.to_mesh(mesh)
+            bm.free()
+            mesh.materials.append(materials[(c * args.objects + o) % len(materials)])
+
+            obj = bpy.data.objects.new(mesh.name, mesh)
+            obj.location = (c * 3.0, o * 3.0, 0.0)
+            collection.objects.link(obj)
+            objects.append(obj)
+
+    configs = scene.taper_configs
+    configs.export_to_folder = True
+    configs.folder_export_path = os.path.join(root, "Export", "")
+
+    bpy.ops.wm.save_as_mainfile(filepath=os.path.join(root, "benchmark.blend"))
+    return materials, objects
+
+
+def run_blender(bench, taper, root, texture_dir):
+    import bpy
+
+    materials, objects = build_scene(root, bench.args, taper)
+    context = bpy.context
+    pull = taper.SubstancePullTexturesOperator
+    clean = taper.SubstanceCleanNodeOperator
+    update = taper.SubstanceUpdateTexturesOperator
+
+    def clean_materials():
+        clean.clean(materials)
+
+    def pull_materials():
+        index = taper.TextureIndex.load(texture_dir)
+        cache = taper.ImageCache()
+        for mat in materials:
+            pull.match_material_slot_with_textures(context, texture_dir, mat.name, index, cache)
+
+    def reload_materials():
+        counts = {'CHANGED': 0, 'UNCHANGED': 0, 'MISSING': 0}
+        seen = set()
+        for mat in materials:
+            update.reload_node_images(mat.name, counts=counts, seen=seen)
+
+    def touch_textures():
+        for entry in os.scandir(texture_dir):
+            os.utime(entry.path)
+
+    bench.measure("pull_match_materials", pull_materials,
+                  setup=clean_materials, materials=len(materials))
+    bench.measure("update_unchanged", reload_materials, materials=len(materials))
+    bench.measure("update_changed", reload_materials,
+                  setup=touch_textures, materials=len(materials))
+
+    layer_collection = context.view_layer.layer_collection.children[0]
+    context.view_layer.active_layer_collection = layer_collection
+
+    bench.measure("export_fbx_collections", bpy.ops.taper.export_fbx_collections,
+                  collections=bench.args.collections)
+    bench.measure("export_fbx_active_collection", bpy.ops.taper.export_fbx_active_collection,
+                  objects=len(layer_collection.collection.all_objects))
+
+    meshes = [obj.data for obj in objects]
+
+    def offset_meshes():
+        for mesh in meshes:
+            co = taper.AutoCenterOperator.get_coordinates(mesh.vertices)
+            taper.AutoCenterOperator.set_coordinates(mesh.vertices, co + 1.0)
+
+    bench.measure("auto_center", lambda: taper.AutoCenterOperator.center_objects(objects),
+                  setup=offset_meshes, objects=len(objects))
+
+    # Run at two sizes, the per face cost should stay flat
+    for count in [max(1, len(meshes) // 4), len(meshes)]:
+        subset = meshes[:count]
+        subset_faces = sum(len(mesh.polygons) for mesh in subset)
+        bench.measure("flip_normals_%d_faces" % subset_faces,
+                      lambda: taper.MeshNormals.process(subset, 'FLIP'),
+                      faces=subset_faces)
+
+
+def compare(results, baseline_path, threshold):
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+
+    regressions = []
+    for name, result in sorted(results.items()):
+        if name in baseline and baseline[name]["min"] > 0:
+            ratio = result["min"] / baseline[name]["min"]
+            print("%-32s %6.2fx" % (name, ratio))
+            if ratio > 1.0 + threshold:
+                regressions.append(name)
+
+    return regressions
+
+
+def main():
+    args = parse_args()
+    stub = args.stub or not "bpy" in sys.modules
+    taper = import_addon(stub)
+
+    root = tempfile.mkdtemp(prefix="taper_benchmark_")
+    bench = Benchmark(args)
+    try:
+        texture_dir = build_texture_folder(root, args)
+        run_matching(bench, taper, texture_dir)
+        run_painter_remote(bench, taper)
+        check_nested_shards(taper)
+        if not stub:
+            run_blender(bench, taper, root, texture_dir)
+    finally:
+        if args.keep:
+            print("Benchmark files kept at : " + root)
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+    import bpy
+    report = {
+        "taper_version": list(taper.bl_info["version"]),
+        "blender": bpy.app.version_string,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": vars(args),
+        "results": bench.results
+    }
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    else:
+        print(json.dumps(report, indent=2, sort_keys=True))
+
+    if args.compare:
+        regressions = compare(bench.results, args.compare, args.threshold)
+        if regressions:
+            print("Regressions: " + ", ".join(regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()